@@ -0,0 +1,101 @@
+import hashlib
+import hmac
+import struct
+import zlib
+from typing import Iterable, Iterator
+
+# Bits of the header tag, written 1 bit per byte right after the length and config
+TAG_BITS = 32
+
+# Payload bytes covered by each CRC32, stored after every block
+CHECK_BLOCK = 1 << 12
+
+CRC = struct.Struct(">I")
+
+
+def header_tag(message_length: int, config: int, key: bytes | None = None) -> int:
+    """
+    Tag of the header fields: a truncated HMAC-SHA256 under key, or a CRC32
+    when there is no key.
+    """
+    fields = struct.pack(">II", message_length, config)
+
+    if key is None:
+        return zlib.crc32(fields)
+
+    return CRC.unpack(hmac.new(key, fields, hashlib.sha256).digest()[:4])[0]
+
+
+def framed_size(size: int) -> int:
+    """
+    Length of a payload of size bytes once a CRC is added after every block.
+    """
+    return size + CRC.size * -(-size // CHECK_BLOCK)
+
+
+def unframed_size(size: int) -> int:
+    """
+    Largest payload fitting in size bytes once framed, the inverse of framed_size.
+    """
+    blocks, rest = divmod(size, CHECK_BLOCK + CRC.size)
+    return blocks * CHECK_BLOCK + max(0, rest - CRC.size)
+
+
+def add_block_crcs(data: bytes) -> bytes:
+    """
+    Frame a payload: every CHECK_BLOCK bytes are followed by their CRC32.
+    """
+    view = memoryview(data)
+    framed = bytearray()
+
+    for i in range(0, len(view), CHECK_BLOCK):
+        block = view[i : i + CHECK_BLOCK]
+        framed += block
+        framed += CRC.pack(zlib.crc32(block))
+
+    return bytes(framed)
+
+
+def check_blocks(chunks: Iterable[bytes], first: int = 0) -> Iterator[bytes]:
+    """
+    Verify and strip the CRCs of a framed payload given in chunks of any size,
+    yielding every block once it has been checked. first is the index of the
+    first block, used in the error message.
+    """
+    framed = CHECK_BLOCK + CRC.size
+    buffer = bytearray()
+    index = first
+
+    def checked(block: bytes) -> bytes:
+        if len(block) <= CRC.size:
+            raise ValueError("The embedded message is truncated.")
+
+        data = block[: -CRC.size]
+
+        if zlib.crc32(data) != CRC.unpack(block[-CRC.size :])[0]:
+            raise ValueError(
+                f"Checksum mismatch in block {index} of the message, "
+                "the audio data is corrupted."
+            )
+
+        return data
+
+    for chunk in chunks:
+        buffer += chunk
+        whole = len(buffer) - len(buffer) % framed
+
+        if not whole:
+            continue
+
+        blocks = bytes(buffer[:whole])
+        del buffer[:whole]
+        out = bytearray()
+
+        for i in range(0, whole, framed):
+            out += checked(blocks[i : i + framed])
+            index += 1
+
+        yield bytes(out)
+
+    if buffer:
+        yield checked(bytes(buffer))
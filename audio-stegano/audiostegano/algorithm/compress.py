@@ -0,0 +1,96 @@
+import bz2
+import lzma
+import zlib
+from typing import Iterable, Iterator
+
+NONE = 0
+ZLIB = 1
+LZMA = 2
+BZ2 = 3
+
+CODEC_NAMES = {NONE: "none", ZLIB: "zlib", LZMA: "lzma", BZ2: "bz2"}
+
+# Codecs are compared on this much of the payload before compressing all of it
+SAMPLE_SIZE = 1 << 16
+
+# Maximum size of a chunk yielded while decompressing
+CHUNK_SIZE = 1 << 20
+
+
+def _compress(data: bytes, codec: int) -> bytes:
+    if codec == ZLIB:
+        return zlib.compress(data, 9)
+    if codec == LZMA:
+        return lzma.compress(data)
+    if codec == BZ2:
+        return bz2.compress(data)
+    return bytes(data)
+
+
+def _decompressor(codec: int):
+    if codec == ZLIB:
+        return zlib.decompressobj()
+    if codec == LZMA:
+        return lzma.LZMADecompressor()
+    if codec == BZ2:
+        return bz2.BZ2Decompressor()
+    raise ValueError(f"Unknown compression codec {codec}.")
+
+
+def compress(data: bytes) -> tuple[int, bytes]:
+    """
+    Compresses data with the stdlib codec giving the smallest output.
+
+    Large payloads pick the codec on a sample of their head. When compression
+    does not make the data smaller, it is returned as is with the NONE codec.
+    """
+    sample = data[:SAMPLE_SIZE]
+    sizes = {codec: len(_compress(sample, codec)) for codec in (ZLIB, LZMA, BZ2)}
+    codec = min(sizes, key=sizes.get)
+
+    if len(data) <= SAMPLE_SIZE and sizes[codec] >= len(data):
+        return NONE, bytes(data)
+
+    compressed = _compress(data, codec)
+
+    if len(compressed) >= len(data):
+        return NONE, bytes(data)
+
+    return codec, compressed
+
+
+def iter_decompress(chunks: Iterable[bytes], codec: int) -> Iterator[bytes]:
+    """
+    Decompresses a stream of chunks, yielding at most CHUNK_SIZE bytes at once.
+    """
+    if codec == NONE:
+        yield from chunks
+        return
+
+    decompressor = _decompressor(codec)
+
+    for chunk in chunks:
+        data = chunk
+
+        while True:
+            out = decompressor.decompress(data, CHUNK_SIZE)
+
+            if out:
+                yield out
+
+            if codec == ZLIB:
+                data = decompressor.unconsumed_tail
+                more = len(data) > 0
+            else:
+                data = b""
+                more = not decompressor.needs_input and not decompressor.eof
+
+            if not more:
+                break
+
+    if not decompressor.eof:
+        raise ValueError("The compressed payload is truncated.")
+
+
+def decompress(data: bytes, codec: int) -> bytes:
+    return b"".join(iter_decompress([data], codec))
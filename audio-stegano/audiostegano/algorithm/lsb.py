@@ -1,111 +1,1108 @@
 import struct  # For packing and unpacking the message length
-from audiostegano.config import RANDOM_SHUFFLE
-from audiostegano.algorithm.shuffle import shuffle, unshuffle
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain
+from typing import BinaryIO, Callable, Iterable, Iterator, NamedTuple
+import numpy as np
+from audiostegano.config import (
+    ENCRYPTED,
+    RANDOM_SHUFFLE,
+    PCG_SHUFFLE,
+    SAMPLE_LSB,
+    DEPTH_SHIFT,
+    DEPTH_MASK,
+    CHECKSUM,
+    BLOCK_SHUFFLE,
+)
+from audiostegano.algorithm.shuffle import (
+    SHUFFLE_BLOCK,
+    shuffle,
+    unshuffle,
+    inverse_permutation,
+    shuffle_block,
+    unshuffle_block,
+    inverse_block_permutation,
+)
+from audiostegano.algorithm.checksum import (
+    TAG_BITS,
+    CHECK_BLOCK,
+    header_tag,
+    framed_size,
+    unframed_size,
+    add_block_crcs,
+    check_blocks,
+)
+from audiostegano.instrument import span
 
+# 32 bits of message length followed by 32 bits of config, always 1 bit per byte
+HEADER_BITS = 64
 
-def encode(raw: bytes, config: int, messages: bytes, seed: int | None = None) -> bytes:
+# The top bit of the length lands in byte 0, which holds the mode bit of a
+# SAMPLE_LSB header, so it is always clear
+MAX_MESSAGE_BITS = (1 << 31) - 1
+
+MAX_DEPTH = 4
+
+# Receives every part of the audio data as (original, modified), modified is None when unchanged
+BlockCallback = Callable[[np.ndarray, np.ndarray | None], None]
+
+
+def get_depth(config: int) -> int:
     """
-    Encodes a secret message into an audio file using basic LSB steganography with message length.
+    Number of LSBs per carrier byte holding the message.
+    """
+    return ((config & DEPTH_MASK) >> DEPTH_SHIFT) + 1
 
-    data is the audio data in bytes
-    meta is the metadata of the messages
+
+def set_depth(config: int, depth: int) -> int:
+    if not 1 <= depth <= MAX_DEPTH:
+        raise ValueError(f"LSB depth must be between 1 and {MAX_DEPTH}.")
+
+    return (config & ~DEPTH_MASK) | ((depth - 1) << DEPTH_SHIFT)
+
+
+def header_bits(config: int) -> int:
+    """
+    Length of the header, followed by the header tag when CHECKSUM is set.
     """
+    return HEADER_BITS + TAG_BITS if config & CHECKSUM else HEADER_BITS
 
-    print("Encoding starts...")
 
-    data = bytearray(raw)
+def _raw_capacity(data_size: int, depth: int, stride: int, base: int) -> int:
+    slots = -(-(data_size - base) // stride)
+    return max(0, slots) * depth // 8
 
-    # Convert the secret message to bits
-    secret_message_bits = "".join([bin(i).lstrip("0b").rjust(8, "0") for i in messages])
 
-    # Add shuffling
-    if config & RANDOM_SHUFFLE:
+def capacity(
+    data_size: int, depth: int = 1, stride: int = 1, checksum: bool = False
+) -> int:
+    """
+    Maximum number of message bytes fitting in data_size bytes of audio data,
+    using depth bits of every stride-th byte. With checksum, room is kept for
+    the header tag and the CRC of every block.
+    """
+    if not checksum:
+        raw = _raw_capacity(data_size, depth, stride, _payload_base(stride))
+        return min(raw, MAX_MESSAGE_BITS // 8)
+
+    header = HEADER_BITS + TAG_BITS
+    raw = _raw_capacity(data_size, depth, stride, _payload_base(stride, header))
+    return unframed_size(min(raw, MAX_MESSAGE_BITS // 8))
+
+
+def to_bits(data: bytes) -> np.ndarray:
+    """
+    Converts bytes into an array holding one bit (MSB first) per element.
+    """
+    return np.unpackbits(np.frombuffer(data, dtype=np.uint8))
+
+
+def from_bits(bits: np.ndarray) -> bytes:
+    """
+    Packs an array of bits (MSB first) back into bytes.
+    """
+    return np.packbits(bits).tobytes()
+
+
+def slice_bits(data: bytes, start: int, stop: int) -> np.ndarray:
+    """
+    Returns bits [start, stop) of data without unpacking the rest of it.
+    """
+    bits = to_bits(memoryview(data)[start // 8 : (stop + 7) // 8])
+    return bits[start % 8 : start % 8 + stop - start]
+
+
+def embed_bits(frame: np.ndarray, bits: np.ndarray, offset: int = 0, depth: int = 1):
+    """
+    Writes the bits into the depth LSBs of frame[offset:] in place, MSB first.
+
+    When the bits do not fill the last byte, its remaining low bits are kept.
+    """
+    if depth == 1:
+        target = frame[offset : offset + len(bits)]
+        np.bitwise_and(target, 0xFE, out=target)
+        np.bitwise_or(target, bits, out=target)
+        return
+
+    count = -(-len(bits) // depth)
+    target = frame[offset : offset + count]
+
+    padding = count * depth - len(bits)
+    padded = np.zeros(count * depth, dtype=np.uint8)
+    padded[: len(bits)] = bits
+
+    values = padded[0::depth] << (depth - 1)
+    for i in range(1, depth):
+        values |= padded[i::depth] << (depth - 1 - i)
+
+    if padding:
+        values[-1] |= target[-1] & ((1 << padding) - 1)
+
+    np.bitwise_and(target, 0xFF ^ ((1 << depth) - 1), out=target)
+    np.bitwise_or(target, values, out=target)
+
+
+def extract_bits(
+    frame: np.ndarray, offset: int, count: int, depth: int = 1
+) -> np.ndarray:
+    """
+    Reads count bits from the depth LSBs of frame[offset:], MSB first.
+    """
+    if depth == 1:
+        return frame[offset : offset + count] & 1
+
+    values = frame[offset : offset - (-count // depth)]
+    bits = np.empty((len(values), depth), dtype=np.uint8)
+
+    for i in range(depth):
+        np.bitwise_and(values >> (depth - 1 - i), 1, out=bits[:, i])
+
+    return bits.ravel()[:count]
+
+
+def _parse_header(
+    frame: np.ndarray, mac_key: bytes | None = None, sample_width: int = 1
+) -> tuple[int, "Layout"]:
+    """
+    Reads the config and the layout of the message from the start of frame,
+    checking the header against its tag when CHECKSUM is set.
+
+    When byte 0 holds the mode bit, the header is on the least significant
+    byte of the following samples, see make_layout. Otherwise it is one bit
+    per byte from byte 0, as in files written before SAMPLE_LSB headers.
+
+    The tag of encrypted messages is keyed with mac_key, it is only checked
+    when the key is given. A wrong key or a damaged header is then rejected
+    before reading the message.
+    """
+    sample_header = sample_width > 1 and bool(frame[0] & 1)
+    slots = frame[sample_width::sample_width] if sample_header else frame
+
+    if len(slots) < HEADER_BITS:
+        raise ValueError("The audio data is too short to contain a message.")
+
+    message_length, config = struct.unpack(
+        ">II", from_bits(extract_bits(slots, 0, HEADER_BITS))
+    )
+
+    if sample_header and not config & SAMPLE_LSB:
+        raise ValueError("The audio data does not hold a valid header.")
+
+    layout = make_layout(config, message_length, sample_width, not sample_header)
+
+    if not config & CHECKSUM:
+        return config, layout
+
+    if len(slots) < HEADER_BITS + TAG_BITS:
+        raise ValueError("The audio data is too short to contain a message.")
+
+    if config & ENCRYPTED:
+        if mac_key is None:
+            return config, layout
+    else:
+        mac_key = None
+
+    (tag,) = struct.unpack(">I", from_bits(extract_bits(slots, HEADER_BITS, TAG_BITS)))
+
+    if tag != header_tag(message_length, config, mac_key):
+        raise ValueError(
+            "The header checksum does not match, the key is wrong or the audio "
+            "data is corrupted."
+        )
+
+    return config, layout
+
+
+def _head_size(sample_width: int) -> int:
+    """
+    Number of audio bytes holding the longest header, with its tag and mode bit.
+    """
+    return (HEADER_BITS + TAG_BITS + 1) * sample_width
+
+
+def _shuffle_packed(job: tuple[bytes, int, int, bool]) -> bytes:
+    """
+    Shuffles, or unshuffles when inverse is set, the bits of block index of a message.
+    Takes and returns packed bits, to keep them small when sent to a worker process.
+    """
+    data, seed, index, inverse = job
+
+    with span("shuffle", len(data)):
+        bits = to_bits(data)
+
+        if inverse:
+            return from_bits(unshuffle_block(bits, seed, index))
+
+        return from_bits(shuffle_block(bits, seed, index))
+
+
+def _ordered_map(
+    function: Callable[[tuple], bytes], jobs: Iterable[tuple], workers: int = 1
+) -> Iterator[bytes]:
+    """
+    map over a pool of worker processes, yielding the results in order.
+
+    Only a few jobs per worker are queued ahead, so the jobs can be produced
+    and the results consumed as a stream.
+    """
+    if workers <= 1:
+        yield from map(function, jobs)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+
+        for job in jobs:
+            pending.append(pool.submit(function, job))
+
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+
+        while pending:
+            yield pending.popleft().result()
+
+
+def _rechunk(chunks: Iterable[bytes], size: int) -> Iterator[bytes]:
+    """
+    Regroups consecutive chunks of bytes into chunks of size bytes, the last one
+    may be shorter.
+    """
+    buffer = bytearray()
+
+    for chunk in chunks:
+        buffer += chunk
+
+        while len(buffer) >= size:
+            yield bytes(buffer[:size])
+            del buffer[:size]
+
+    if buffer:
+        yield bytes(buffer)
+
+
+def _shuffle_blocks(
+    chunks: Iterable[bytes], seed: int, inverse: bool, workers: int = 1
+) -> Iterator[bytes]:
+    """
+    Shuffles, or unshuffles, a message given in chunks of any size block by
+    block, on workers processes.
+    """
+    jobs = (
+        (block, seed, index, inverse)
+        for index, block in enumerate(_rechunk(chunks, SHUFFLE_BLOCK // 8))
+    )
+
+    return _ordered_map(_shuffle_packed, jobs, workers)
+
+
+def _message_reader(
+    config: int, messages: bytes, seed: int | None, workers: int = 1
+) -> Callable[[int, int], np.ndarray]:
+    """
+    Returns a function reading bits [start, stop) of the (optionally shuffled) message.
+    """
+    if config & BLOCK_SHUFFLE:
+        _check_seed(config, seed)
+
+        # Blocks are shuffled as they are needed, the bits are read in order
+        blocks = _shuffle_blocks([messages], seed, False, workers)
+        window = bytearray()
+        window_start = 0
+
+        def message_bits(start: int, stop: int) -> np.ndarray:
+            nonlocal window_start
+
+            if start // 8 > window_start:
+                del window[: start // 8 - window_start]
+                window_start = start // 8
+
+            while window_start + len(window) < -(-stop // 8):
+                window.extend(next(blocks))
+
+            offset = window_start * 8
+            needed = bytes(window[: -(-stop // 8) - window_start])
+            return slice_bits(needed, start - offset, stop - offset)
+
+    elif config & RANDOM_SHUFFLE:
         if seed is None:
             raise Exception(
                 "Seed cannot be None when using random shuffle. Consider adding secret key"
             )
 
-        secret_message_bits = shuffle(secret_message_bits, seed)
+        # Shuffling mixes the whole message, so its bits have to be materialized
+        with span("bitify", len(messages)):
+            bits = to_bits(messages)
+
+        with span("shuffle", len(messages)):
+            shuffled_bits = shuffle(bits, seed, legacy=not config & PCG_SHUFFLE)
+
+        def message_bits(start: int, stop: int) -> np.ndarray:
+            return shuffled_bits[start:stop]
+
+    else:
+
+        def message_bits(start: int, stop: int) -> np.ndarray:
+            return slice_bits(messages, start, stop)
+
+    return message_bits
+
+
+class Layout(NamedTuple):
+    """
+    Location of the message bits in the audio data: depth bits in every
+    stride-th byte, starting from byte base. The header bits are in the
+    first header bytes of every header_stride-th byte.
+    """
 
-    message_length = len(secret_message_bits)
+    message_length: int
+    depth: int
+    base: int
+    stride: int
+    header: int = HEADER_BITS
+    header_stride: int = 1
 
-    # Pack the length of the message into 4 bytes (32 bits)
-    length_bytes = struct.pack(">I", message_length)  # '>I' is big-endian unsigned int
+    @property
+    def slots(self) -> int:
+        """
+        Number of audio bytes holding message bits.
+        """
+        return -(-self.message_length // self.depth)
 
-    # Convert the length bytes to bits
-    length_bits = "".join(
-        [bin(byte).lstrip("0b").rjust(8, "0") for byte in length_bytes]
+    @property
+    def used_bytes(self) -> int:
+        """
+        Length of the prefix of the audio data holding the header and the message.
+        """
+        if self.slots == 0:
+            return (self.header - 1) * self.header_stride + 1
+        return self.base + (self.slots - 1) * self.stride + 1
+
+    def slot_range(self, start: int, stop: int) -> tuple[int, int]:
+        """
+        Indexes of the first and past the last slot within audio bytes [start, stop).
+        """
+        first = max(0, -(-(start - self.base) // self.stride))
+        last = min(self.slots, -(-(stop - self.base) // self.stride))
+        return first, max(first, last)
+
+
+def _payload_base(stride: int, header: int = HEADER_BITS) -> int:
+    # First sample after the header and its mode bit, one per sample
+    return header if stride == 1 else (header + 1) * stride
+
+
+def get_stride(config: int, sample_width: int) -> int:
+    """
+    Distance between two bytes holding message bits: every byte, or only the
+    least significant byte of every sample when SAMPLE_LSB is set.
+    """
+    return sample_width if config & SAMPLE_LSB else 1
+
+
+def make_layout(
+    config: int, message_length: int, sample_width: int = 1, legacy_header: bool = False
+) -> Layout:
+    """
+    Layout of a message of message_length bits encoded with config.
+
+    With SAMPLE_LSB and multi-byte samples, the header goes on the least
+    significant byte of every sample too, after a mode bit set in byte 0 so
+    the decoder can tell where to read it. Other headers, and the ones of files
+    written before that with legacy_header, are one bit per byte from byte 0.
+    """
+    depth = get_depth(config)
+    stride = get_stride(config, sample_width)
+    header = header_bits(config)
+
+    if stride == 1 or legacy_header:
+        return Layout(
+            message_length, depth, -(-header // stride) * stride, stride, header
+        )
+
+    return Layout(
+        message_length,
+        depth,
+        _payload_base(stride, header),
+        stride,
+        header + 1,
+        stride,
     )
 
-    # Pack the length of the message into 4 bytes (32 bits)
-    meta_bytes = struct.pack(">I", config)  # '>I' is big-endian unsigned int
 
-    # Convert the meta bytes to bits
-    meta_bits = "".join([bin(byte).lstrip("0b").rjust(8, "0") for byte in meta_bytes])
+def _embed_header(frame: np.ndarray, start: int, header_bits: np.ndarray, step: int):
+    """
+    Embeds the header bits falling in frame, which holds the audio bytes from
+    position start, one bit in every step-th byte.
+    """
+    first = -(-start // step)
+    last = min(len(header_bits), -(-(start + len(frame)) // step))
+
+    if last > first:
+        embed_bits(frame[first * step - start :: step], header_bits[first:last])
+
+
+def _embed_block(
+    frame: np.ndarray,
+    start: int,
+    header_bits: np.ndarray,
+    message_bits: Callable[[int, int], np.ndarray],
+    layout: Layout,
+):
+    """
+    Embeds whatever falls in frame, which holds the audio bytes from position start.
+    """
+    stop = start + len(frame)
+
+    _embed_header(frame, start, header_bits, layout.header_stride)
+
+    first, last = layout.slot_range(start, stop)
+
+    if last > first:
+        depth = layout.depth
+        bits = message_bits(first * depth, min(last * depth, layout.message_length))
+        slots = frame[layout.base + first * layout.stride - start :: layout.stride]
+        embed_bits(slots, bits, 0, depth)
+
+
+def _extract_block(frame: np.ndarray, start: int, layout: Layout) -> np.ndarray:
+    """
+    Extracts the message bits held by frame, which holds the audio bytes from position start.
+    """
+    first, last = layout.slot_range(start, start + len(frame))
+
+    if last == first:
+        return np.empty(0, dtype=np.uint8)
+
+    depth = layout.depth
+    count = min(last * depth, layout.message_length) - first * depth
+    slots = frame[layout.base + first * layout.stride - start :: layout.stride]
+    return extract_bits(slots, 0, count, depth)
 
-    # Combine length bits and message bits
-    full_bits = length_bits + meta_bits + secret_message_bits
+
+def _prepare_encode(
+    data_size: int,
+    config: int,
+    messages: bytes,
+    seed: int | None,
+    sample_width: int,
+    mac_key: bytes | None,
+    workers: int,
+) -> tuple[np.ndarray, Callable[[int, int], np.ndarray], Layout]:
+    checksum = bool(config & CHECKSUM)
+    depth = get_depth(config)
+    stride = get_stride(config, sample_width)
+    available = capacity(data_size, depth, stride, checksum)
 
     # Ensure the message fits into the frame bytes
-    if len(full_bits) > len(data):
-        raise ValueError("The message is too large to fit in the audio file.")
+    if len(messages) > available:
+        raise ValueError(
+            "The message is too large to fit in the audio file "
+            f"({len(messages)} bytes, capacity {available} bytes at depth {depth})."
+        )
+
+    if checksum:
+        with span("checksum", len(messages)):
+            messages = add_block_crcs(messages)
+
+    layout = make_layout(config, len(messages) * 8, sample_width)
+
+    # Pack the length of the message and the config into 4 bytes (32 bits) each
+    header = struct.pack(">II", layout.message_length, config)
+
+    if checksum:
+        key = mac_key if config & ENCRYPTED else None
+        header += struct.pack(">I", header_tag(layout.message_length, config, key))
+
+    header_bits = to_bits(header)
+
+    if layout.header_stride > 1:
+        # Mode bit of a header on the sample LSBs
+        header_bits = np.concatenate([np.ones(1, dtype=np.uint8), header_bits])
+
+    return header_bits, _message_reader(config, messages, seed, workers), layout
+
+
+def encode(
+    raw: bytes,
+    config: int,
+    messages: bytes,
+    seed: int | None = None,
+    on_block: BlockCallback | None = None,
+    sample_width: int = 1,
+    mac_key: bytes | None = None,
+    workers: int = 1,
+) -> bytes:
+    """
+    Encodes a secret message into an audio file using basic LSB steganography with message length.
+
+    data is the audio data in bytes
+    meta is the metadata of the messages
+    on_block is called with (original, modified) for the modified part of the audio,
+    then with (original, None) for the unchanged rest
+    sample_width is the size of a PCM sample, used when SAMPLE_LSB is set
+    mac_key keys the header tag of encrypted messages when CHECKSUM is set
+    workers is the number of processes shuffling the blocks when BLOCK_SHUFFLE is set
+    """
+
+    print("Encoding starts...")
+
+    frame = np.frombuffer(raw, dtype=np.uint8)
 
-    # Encode the full bits into the frame bytes
-    for i, bit in enumerate(full_bits):
-        data[i] = (data[i] & 254) | int(bit)
+    # Encode the header and the message bits into the frame bytes
+    prepared = _prepare_encode(
+        len(frame), config, messages, seed, sample_width, mac_key, workers
+    )
+
+    with span("embed", len(frame)):
+        data = np.array(frame)
+        _embed_block(data, 0, *prepared)
+
+    if on_block is not None:
+        used_bytes = prepared[2].used_bytes
+        on_block(frame[:used_bytes], data[:used_bytes])
+        on_block(frame[used_bytes:], None)
 
-    data_modified = bytes(data)
+    data_modified = data.tobytes()
 
     print("Encoding success ...")
 
     return data_modified
 
 
-def decode(raw: bytes, seed: int | None = None) -> tuple[bytes, int]:
+def encode_stream(
+    blocks: Iterable[bytes],
+    data_size: int,
+    config: int,
+    messages: bytes,
+    seed: int | None = None,
+    on_block: BlockCallback | None = None,
+    sample_width: int = 1,
+    mac_key: bytes | None = None,
+    workers: int = 1,
+) -> Iterator[bytes]:
     """
-    Decodes a secret message from an audio bytes using basic LSB steganography with message length.
+    Streaming variant of encode.
 
-    :param input_file_path: Path to the encoded audio file
-    :return: The decoded secret message
+    blocks is the audio data split in consecutive chunks and data_size is their total size.
+    Yields the chunks in order, only the ones holding message bits are modified.
+    The input is validated before anything is yielded.
+    on_block, sample_width, mac_key and workers are used as in encode.
     """
-    print("Decoding starts...")
-    frame_bytes = bytearray(raw)
+    prepared = _prepare_encode(
+        data_size, config, messages, seed, sample_width, mac_key, workers
+    )
+    used_bytes = prepared[2].used_bytes
 
-    # Extract the first 32 bits to determine the message length
-    length_bits = "".join([str((frame_bytes[i] & 1)) for i in range(32)])
-    message_length = struct.unpack(
-        ">I", int(length_bits, 2).to_bytes(4, byteorder="big")
-    )[0]
+    def run() -> Iterator[bytes]:
+        print("Encoding starts...")
 
-    config_bits = "".join([str((frame_bytes[i + 32] & 1)) for i in range(32)])
-    config = struct.unpack(">I", int(config_bits, 2).to_bytes(4, byteorder="big"))[0]
+        position = 0
 
-    # Now extract the message bits using the extracted length
-    if message_length > len(frame_bytes) * 8:
-        raise ValueError(
-            "The extracted message length is larger than the available audio data."
+        for block in blocks:
+            start = position
+            position += len(block)
+
+            frame = np.frombuffer(block, dtype=np.uint8)
+
+            if start >= used_bytes:
+                if on_block is not None:
+                    on_block(frame, None)
+
+                yield block
+                continue
+
+            with span("embed", len(frame)):
+                data = np.array(frame)
+                _embed_block(data, start, *prepared)
+
+            if on_block is not None:
+                on_block(frame, data)
+
+            yield data.tobytes()
+
+        print("Encoding success ...")
+
+    return run()
+
+
+def _check_seed(config: int, seed: int | None):
+    if config & (RANDOM_SHUFFLE | BLOCK_SHUFFLE) and seed is None:
+        raise Exception(
+            "Seed cannot be None when using random shuffle. Consider adding secret key"
         )
 
-    message_bits = "".join(
-        [str((frame_bytes[i + 64] & 1)) for i in range(message_length)]
-    )
+
+def _finish_decode(
+    message_bits: np.ndarray, config: int, seed: int | None, workers: int = 1
+) -> tuple[bytes, int]:
+    _check_seed(config, seed)
 
     # Unshuffle
     if config & RANDOM_SHUFFLE:
-        if seed is None:
-            raise Exception(
-                "Seed cannot be None when using random shuffle. Consider adding secret key"
+        with span("shuffle", len(message_bits) // 8):
+            message_bits = unshuffle(
+                message_bits, seed, legacy=not config & PCG_SHUFFLE
             )
 
-        message_bits = unshuffle(message_bits, seed)
-
     # Convert bits back to bytes
-    decoded_message = bytes(
-        bytearray(
-            [int(message_bits[i : i + 8], 2) for i in range(0, len(message_bits), 8)]
+    with span("bitify", len(message_bits) // 8):
+        decoded_message = from_bits(message_bits)
+
+    if config & BLOCK_SHUFFLE:
+        decoded_message = b"".join(
+            _shuffle_blocks([decoded_message], seed, True, workers)
         )
-    )
+
+    if config & CHECKSUM:
+        with span("checksum", len(decoded_message)):
+            decoded_message = b"".join(check_blocks([decoded_message]))
 
     print("Decoding success")
 
     return decoded_message, config
+
+
+def _pack_stream(bit_chunks: Iterable[np.ndarray]) -> Iterator[bytes]:
+    """
+    Packs consecutive chunks of bits into bytes, carrying over the bits that
+    do not make a whole byte at the end of a chunk.
+    """
+    carry = np.empty(0, dtype=np.uint8)
+
+    for bits in bit_chunks:
+        if len(carry):
+            bits = np.concatenate([carry, bits])
+
+        whole = len(bits) - len(bits) % 8
+        carry = bits[whole:]
+
+        if whole:
+            with span("bitify", whole // 8):
+                packed = from_bits(bits[:whole])
+
+            yield packed
+
+    if len(carry):
+        yield from_bits(carry)
+
+
+def _payload_chunks(
+    bit_chunks: Iterator[np.ndarray],
+    config: int,
+    seed: int | None,
+    message_length: int,
+    chunk_size: int,
+    workers: int = 1,
+) -> Iterator[bytes]:
+    """
+    The message bytes held by consecutive chunks of extracted bits.
+
+    Without shuffling, every chunk is packed and yielded as soon as it is read.
+    The global shuffle permutation mixes bits from the whole message, so these
+    have to be gathered before being unshuffled and yielded chunk_size bytes at a time.
+    With BLOCK_SHUFFLE, every block is unshuffled once read, on workers processes.
+    With CHECKSUM, every block is yielded once its CRC has been checked.
+    """
+
+    def counted() -> Iterator[np.ndarray]:
+        count = 0
+
+        for bits in bit_chunks:
+            count += len(bits)
+            yield bits
+
+        if count < message_length:
+            raise ValueError("The audio data ended before the whole message was read.")
+
+    def packed() -> Iterator[bytes]:
+        if config & BLOCK_SHUFFLE:
+            yield from _shuffle_blocks(_pack_stream(counted()), seed, True, workers)
+            return
+
+        if not config & RANDOM_SHUFFLE:
+            yield from _pack_stream(counted())
+            return
+
+        message_bits = np.concatenate([np.empty(0, dtype=np.uint8), *counted()])
+
+        with span("shuffle", len(message_bits) // 8):
+            message_bits = unshuffle(
+                message_bits, seed, legacy=not config & PCG_SHUFFLE
+            )
+
+        step = max(1, chunk_size) * 8
+
+        for i in range(0, len(message_bits), step):
+            with span("bitify", step // 8):
+                chunk = from_bits(message_bits[i : i + step])
+
+            yield chunk
+
+    chunks = packed()
+
+    if config & CHECKSUM:
+        chunks = check_blocks(chunks)
+
+    yield from chunks
+
+    print("Decoding success")
+
+
+def _check_length(layout: Layout, data_size: int):
+    available = _raw_capacity(data_size, layout.depth, layout.stride, layout.base)
+
+    if layout.message_length > available * 8:
+        raise ValueError(
+            "The extracted message length is larger than the available audio data."
+        )
+
+
+def decode(
+    raw: bytes,
+    seed: int | None = None,
+    sample_width: int = 1,
+    mac_key: bytes | None = None,
+    workers: int = 1,
+) -> tuple[bytes, int]:
+    """
+    Decodes a secret message from an audio bytes using basic LSB steganography with message length.
+
+    :param input_file_path: Path to the encoded audio file
+    :param sample_width: Size of a PCM sample, used when the file was encoded with SAMPLE_LSB
+    :param mac_key: Key of the header tag, checked when the file was encoded with CHECKSUM
+    :param workers: Number of processes unshuffling the blocks when encoded with BLOCK_SHUFFLE
+    :return: The decoded secret message
+    """
+    print("Decoding starts...")
+    frame = np.frombuffer(raw, dtype=np.uint8)
+
+    if len(frame) < HEADER_BITS:
+        raise ValueError("The audio data is too short to contain a message.")
+
+    # Extract the first 64 bits to determine the message length and config
+    config, layout = _parse_header(frame, mac_key, sample_width)
+
+    # Now extract the message bits using the extracted length
+    _check_length(layout, len(frame))
+
+    with span("extract", layout.used_bytes):
+        message_bits = _extract_block(frame, 0, layout)
+
+    return _finish_decode(message_bits, config, seed, workers)
+
+
+def decode_stream(
+    blocks: Iterable[bytes],
+    data_size: int,
+    seed: int | None = None,
+    sample_width: int = 1,
+    mac_key: bytes | None = None,
+    workers: int = 1,
+) -> tuple[bytes, int]:
+    """
+    Streaming variant of decode.
+
+    blocks is the audio data split in consecutive chunks and data_size is their total size.
+    sample_width, mac_key and workers are used as in decode.
+    Stops consuming blocks as soon as the whole message has been read.
+    """
+    config, chunks = iter_decode_stream(
+        blocks, data_size, seed, sample_width, mac_key=mac_key, workers=workers
+    )
+    return b"".join(chunks), config
+
+
+def iter_decode_stream(
+    blocks: Iterable[bytes],
+    data_size: int,
+    seed: int | None = None,
+    sample_width: int = 1,
+    chunk_size: int = 1 << 20,
+    mac_key: bytes | None = None,
+    workers: int = 1,
+) -> tuple[int, Iterator[bytes]]:
+    """
+    Variant of decode_stream yielding the message in chunks, as blocks are read.
+
+    Returns the config, read from the header right away, and an iterator over
+    the message bytes. Unshuffled messages are yielded block by block, see
+    _payload_chunks for shuffled ones.
+    """
+    print("Decoding starts...")
+
+    blocks = iter(blocks)
+
+    # The header and its tag may span several blocks
+    head = b""
+
+    for block in blocks:
+        head += block
+
+        if len(head) >= _head_size(sample_width):
+            break
+
+    if len(head) < HEADER_BITS:
+        raise ValueError("The audio data is too short to contain a message.")
+
+    config, layout = _parse_header(
+        np.frombuffer(head, dtype=np.uint8), mac_key, sample_width
+    )
+    message_length = layout.message_length
+
+    _check_length(layout, data_size)
+    _check_seed(config, seed)
+
+    def bit_chunks() -> Iterator[np.ndarray]:
+        used_bytes = layout.used_bytes
+        position = 0
+
+        for block in chain([head], blocks):
+            start = position
+            position += len(block)
+
+            with span("extract", len(block)):
+                frame = np.frombuffer(block, dtype=np.uint8)
+                bits = _extract_block(frame, start, layout)
+
+            yield bits
+
+            if position >= used_bytes:
+                break
+
+    return config, _payload_chunks(
+        bit_chunks(), config, seed, message_length, chunk_size, workers
+    )
+
+
+def decode_file(
+    f: BinaryIO,
+    data_offset: int,
+    data_size: int,
+    seed: int | None = None,
+    sample_width: int = 1,
+    mac_key: bytes | None = None,
+    workers: int = 1,
+) -> tuple[bytes, int]:
+    """
+    Variant of decode for a seekable file holding the audio data at data_offset.
+
+    Only the header and then the byte range holding the message are read, so
+    the work depends on the message length and not on the audio length.
+    sample_width, mac_key and workers are used as in decode.
+    """
+    config, chunks = iter_decode_file(
+        f, data_offset, data_size, seed, sample_width, mac_key=mac_key, workers=workers
+    )
+    return b"".join(chunks), config
+
+
+def _read_layout(
+    f: BinaryIO,
+    data_offset: int,
+    data_size: int,
+    mac_key: bytes | None,
+    sample_width: int,
+) -> tuple[int, Layout]:
+    f.seek(data_offset)
+    head = f.read(min(data_size, _head_size(sample_width)))
+
+    if len(head) < HEADER_BITS:
+        raise ValueError("The audio data is too short to contain a message.")
+
+    return _parse_header(np.frombuffer(head, dtype=np.uint8), mac_key, sample_width)
+
+
+def read_header(
+    f: BinaryIO,
+    data_offset: int,
+    data_size: int,
+    mac_key: bytes | None = None,
+    sample_width: int = 1,
+) -> tuple[int, int]:
+    """
+    Read the message length in bits and the config from the header of the
+    audio data at data_offset in a seekable file, see _parse_header for
+    mac_key and sample_width.
+    """
+    config, layout = _read_layout(f, data_offset, data_size, mac_key, sample_width)
+    return layout.message_length, config
+
+
+def iter_decode_file(
+    f: BinaryIO,
+    data_offset: int,
+    data_size: int,
+    seed: int | None = None,
+    sample_width: int = 1,
+    block_size: int = 1 << 20,
+    mac_key: bytes | None = None,
+    workers: int = 1,
+) -> tuple[int, Iterator[bytes]]:
+    """
+    Variant of decode_file yielding the message in chunks.
+
+    Returns the config, read from the header right away, and an iterator over
+    the message bytes. The byte range holding the message is read about
+    block_size bytes at a time, unshuffled messages are yielded as they are read.
+    """
+    print("Decoding starts...")
+
+    config, layout = _read_layout(f, data_offset, data_size, mac_key, sample_width)
+    message_length = layout.message_length
+
+    _check_length(layout, data_size)
+    _check_seed(config, seed)
+
+    def bit_chunks() -> Iterator[np.ndarray]:
+        stride = layout.stride
+        per_read = max(8, block_size // stride)
+
+        # The message starts at or after the end of the header
+        for first in range(0, layout.slots, per_read):
+            last = min(layout.slots, first + per_read)
+            start = layout.base + first * stride
+            size = (last - 1 - first) * stride + 1
+
+            with span("extract", size):
+                f.seek(data_offset + start)
+                body = f.read(size)
+
+                if len(body) < size:
+                    raise ValueError(
+                        "The audio data ended before the whole message was read."
+                    )
+
+                frame = np.frombuffer(body, dtype=np.uint8)
+                bits = _extract_block(frame, start, layout)
+
+            yield bits
+
+    return config, _payload_chunks(
+        bit_chunks(), config, seed, message_length, block_size, workers
+    )
+
+
+class PayloadReader:
+    """
+    Random access to the message embedded in audio data.
+
+    Only the audio bytes holding the requested message bytes are read, so with
+    memory-mapped audio data a small part of a large message is cheap to read.
+    Shuffled messages need the inverse of the shuffle permutation, which is
+    computed once for the whole message, or with BLOCK_SHUFFLE for the blocks
+    holding the requested bytes only. With CHECKSUM, the checksum blocks
+    holding the requested bytes are read whole to check their CRC.
+    """
+
+    def __init__(
+        self,
+        raw,
+        seed: int | None = None,
+        sample_width: int = 1,
+        mac_key: bytes | None = None,
+    ):
+        self.frame = np.frombuffer(raw, dtype=np.uint8)
+
+        if len(self.frame) < HEADER_BITS:
+            raise ValueError("The audio data is too short to contain a message.")
+
+        self.config, self.layout = _parse_header(self.frame, mac_key, sample_width)
+        message_length = self.layout.message_length
+
+        _check_length(self.layout, len(self.frame))
+        _check_seed(self.config, seed)
+
+        self._seed = seed
+        self._inverse = None
+        self._block_inverse: tuple[int, np.ndarray] | None = None
+
+        if self.config & RANDOM_SHUFFLE:
+            with span("shuffle", message_length // 8):
+                self._inverse = inverse_permutation(
+                    message_length, seed, legacy=not self.config & PCG_SHUFFLE
+                )
+
+    @property
+    def size(self) -> int:
+        """
+        Length of the message in bytes.
+        """
+        size = self.layout.message_length // 8
+
+        if self.config & CHECKSUM:
+            return unframed_size(size)
+
+        return size
+
+    def read(self, offset: int, length: int) -> bytes:
+        """
+        Reads length bytes of the message from offset.
+        """
+        if offset < 0 or length < 0 or offset + length > self.size:
+            raise ValueError("Read past the end of the embedded message.")
+
+        if not self.config & CHECKSUM:
+            return self._read(offset, length)
+
+        if length == 0:
+            return b""
+
+        framed = framed_size(CHECK_BLOCK)
+        first = offset // CHECK_BLOCK
+        last = (offset + length - 1) // CHECK_BLOCK + 1
+        start = first * framed
+        stop = min(self.layout.message_length // 8, last * framed)
+
+        with span("checksum", stop - start):
+            data = b"".join(check_blocks([self._read(start, stop - start)], first))
+
+        skip = offset - first * CHECK_BLOCK
+        return data[skip : skip + length]
+
+    def _read(self, offset: int, length: int) -> bytes:
+        layout = self.layout
+        start, stop = offset * 8, (offset + length) * 8
+
+        with span("extract", length):
+            if self.config & BLOCK_SHUFFLE:
+                positions = self._block_positions(start, stop)
+            elif self._inverse is not None:
+                positions = self._inverse[start:stop]
+            else:
+                first = start // layout.depth
+                last = -(-stop // layout.depth)
+                begin = layout.base + first * layout.stride
+                end = layout.base + (last - 1) * layout.stride + 1
+
+                bits = _extract_block(self.frame[begin:end], begin, layout)
+                return from_bits(bits[start - first * layout.depth :][: stop - start])
+
+            # Bit i of the shuffled message is the (i % depth)-th MSB of slot i // depth
+            slots, shifts = np.divmod(positions, layout.depth)
+            values = self.frame[layout.base + slots * layout.stride]
+            bits = (values >> (layout.depth - 1 - shifts)).astype(np.uint8) & 1
+
+            return from_bits(bits)
+
+    def _block_positions(self, start: int, stop: int) -> np.ndarray:
+        """
+        Position in the shuffled message of bits [start, stop), with BLOCK_SHUFFLE.
+        """
+        parts = [np.empty(0, dtype=np.intp)]
+
+        for index in range(start // SHUFFLE_BLOCK, -(-stop // SHUFFLE_BLOCK)):
+            base = index * SHUFFLE_BLOCK
+
+            # Reads are mostly sequential, so the last block is kept
+            if self._block_inverse is None or self._block_inverse[0] != index:
+                n = min(SHUFFLE_BLOCK, self.layout.message_length - base)
+
+                with span("shuffle", n // 8):
+                    inverse = inverse_block_permutation(n, self._seed, index)
+
+                self._block_inverse = (index, inverse)
+
+            inverse = self._block_inverse[1]
+            parts.append(base + inverse[max(start, base) - base : stop - base])
+
+        return np.concatenate(parts)
@@ -1,76 +1,247 @@
 import numpy as np
 import math
 import io
-from pydub import AudioSegment
+from audiostegano.input.wav import (
+    WavInfo,
+    read_wav_info,
+    clip_wav_info,
+    pcm_view,
+    pcm_samples,
+)
 
+# Frames converted to float at once, bounds the temporary buffers
+CHUNK_FRAMES = 1 << 18
 
-def calculate_psnr(wav_bytes1: bytes, wav_bytes2: bytes):
+
+def _mono_samples(data: np.ndarray, info: WavInfo) -> np.ndarray:
     """
-    Calculate PSNR between two WAV files provided as bytes data using pydub.
+    Mono samples of PCM data, with the same values pydub yields for
+    set_channels(1).get_array_of_samples() so PSNR values stay unchanged.
+    """
+    samples = pcm_samples(data, info)
 
-    Uses the formula: PSNR = 10 * log_10((P_1^2)/(P_1^2+P_0^2-2*P_1*P_0))
+    if info.sample_width == 3:
+        # pydub widens 24-bit audio to 32-bit by prepending a sign byte
+        samples = (samples << 8) | np.where(samples < 0, 0xFF, 0)
 
-    Args:
-        wav_bytes1: Bytes data of the first WAV file
-        wav_bytes2: Bytes data of the second WAV file
+    if info.channels == 2:
+        # audioop.tomono with 0.5 factors
+        return (samples[:, 0] + samples[:, 1]) >> 1
 
-    Returns:
-        PSNR value in dB
+    if info.channels > 2:
+        return (samples // info.channels).sum(axis=1)
+
+    return samples[:, 0]
+
+
+def _max_value(info: WavInfo) -> float:
+    sample_width = 4 if info.sample_width == 3 else info.sample_width
+    return float(2 ** (sample_width * 8 - 1))
+
+
+def signal_power(data: np.ndarray, info: WavInfo) -> float:
+    """
+    Mean square of the normalized mono samples, the P^2 terms of the PSNR formula.
     """
+    frames = len(data) // info.frame_width
+    end = frames * info.frame_width
+    step = CHUNK_FRAMES * info.frame_width
+    power = 0.0
 
-    audio1: AudioSegment = AudioSegment.from_wav(io.BytesIO(wav_bytes1))
-    audio2: AudioSegment = AudioSegment.from_wav(io.BytesIO(wav_bytes2))
+    for i in range(0, end, step):
+        samples = _mono_samples(data[i : min(i + step, end)], info)
+        samples = samples.astype(np.float64)
+        samples /= _max_value(info)
+        power += float(np.dot(samples, samples))
+
+    return power / frames if frames else 0.0
 
-    # Check if sample rates match
-    if audio1.frame_rate != audio2.frame_rate:
-        raise ValueError(
-            f"Sample rates do not match: {audio1.frame_rate} vs {audio2.frame_rate}"
-        )
 
-    # Convert to mono
-    if audio1.channels > 1:
-        audio1 = audio1.set_channels(1)
-    if audio2.channels > 1:
-        audio2 = audio2.set_channels(1)
+def _byte_variance(info: WavInfo, depth: int, positions: int) -> float:
+    """
+    Normalized error variance of replacing the depth LSBs of an audio byte with
+    random bits, averaged over the first positions bytes of a sample.
 
-    # Make sure both audios have the same length
-    min_length = min(len(audio1), len(audio2))
-    audio1 = audio1[:min_length]
-    audio2 = audio2[:min_length]
+    Replacing k random bits by k other random bits has an error variance of
+    (4^k - 1) / 6, scaled by 256^2 for every byte further from the LSB of a sample.
+    """
+    variance = (4**depth - 1) / 6
+    byte_variance = np.mean([variance * 256 ** (2 * p) for p in range(positions)])
+    return float(byte_variance) / float(2 ** (info.sample_width * 8 - 1)) ** 2
+
+
+def estimate_psnr(
+    power: float,
+    info: WavInfo,
+    modified_bytes: int,
+    depth: int,
+    sample_lsb: bool = False,
+    header_bytes: int = 0,
+):
+    """
+    Expected PSNR after replacing the depth LSBs of modified_bytes audio bytes
+    with random bits, given the signal power of the audio. The bytes are either
+    consecutive, or only the least significant byte of samples with sample_lsb.
+    header_bytes bytes, placed the same way, get one random bit each on top of that.
 
-    # Get samples as numpy arrays
-    # pydub samples are integers in the range [-2^(sample_width*8-1), 2^(sample_width*8-1)-1]
-    samples1 = np.array(audio1.get_array_of_samples()).astype(np.float64)
-    samples2 = np.array(audio2.get_array_of_samples()).astype(np.float64)
+    The mono mix divides the error of each channel by the channel count.
+    """
+    frames = info.data_size // info.frame_width
 
-    # Normalize samples based on sample width
-    max_value = float(2 ** (audio1.sample_width * 8 - 1))
-    samples1 /= max_value
-    samples2 /= max_value
+    if modified_bytes + header_bytes == 0 or frames == 0:
+        return float("inf")
+
+    if power <= 0:
+        return float("-inf")
+
+    positions = 1 if sample_lsb else info.sample_width
+    error = modified_bytes * _byte_variance(info, depth, positions)
+    error += header_bytes * _byte_variance(info, 1, positions)
+
+    mse = error / info.channels**2 / frames
+
+    return 10 * math.log10(power / mse)
+
+
+def _trimmed_frames(frames: int, sample_rate: int) -> int:
+    """
+    pydub used to trim both audios to their length in whole milliseconds.
+    """
+    length_ms = round(1000 * (frames / sample_rate))
+    return min(frames, int(length_ms * (sample_rate / 1000.0)))
 
-    # Calculate P_0^2
-    P0_squared = np.mean(np.square(samples1))
 
-    # Calculate P_1^2
-    P1_squared = np.mean(np.square(samples2))
+class PsnrAccumulator:
+    """
+    Computes the PSNR between an audio and its modified copy block by block.
 
-    # Calculate P_1*P_0
-    P1_P0 = np.mean(samples1 * samples2)
+    Uses the formula: PSNR = 10 * log_10((P_1^2)/(P_1^2+P_0^2-2*P_1*P_0))
 
-    # print(f"P0sq {P0_squared} P1sq {P1_squared} P0P1 {P1_P0}")
+    The denominator is the mean square of the difference between both audios,
+    so it is accumulated from the modified blocks only, while the unchanged
+    ones just add to P_1^2. Blocks may be split anywhere, not only on frames.
+    """
 
-    # Calculate PSNR using the given formula
-    numerator = P1_squared
-    denominator = P1_squared + P0_squared - 2 * P1_P0
+    CHUNK_FRAMES = CHUNK_FRAMES
 
-    # Avoid division by zero or negative values
-    if denominator <= 0:
-        if denominator == 0:
+    def __init__(self, info: WavInfo):
+        self.info = info
+        self.frames = _trimmed_frames(
+            info.data_size // info.frame_width, info.sample_rate
+        )
+        self.seen = 0
+        self.power = 0.0
+        self.error = 0.0
+        self._carry: tuple[np.ndarray, np.ndarray] | None = None
+        self._carry_changed = False
+
+    def update(self, original: np.ndarray, modified: np.ndarray | None = None):
+        """
+        Adds the next block of PCM data. modified is None when the block was left unchanged.
+        """
+        changed = modified is not None
+        if modified is None:
+            modified = original
+
+        width = self.info.frame_width
+
+        # Complete a frame split across the previous block and this one
+        if self._carry is not None:
+            need = width - len(self._carry[0])
+            head_original = np.concatenate([self._carry[0], original[:need]])
+            head_modified = np.concatenate([self._carry[1], modified[:need]])
+            head_changed = changed or self._carry_changed
+            self._carry = None
+
+            if len(head_original) < width:
+                self._carry = (head_original, head_modified)
+                self._carry_changed = head_changed
+                return
+
+            self._add(head_original, head_modified, head_changed)
+            original = original[need:]
+            modified = modified[need:]
+
+        whole = len(original) - len(original) % width
+
+        if whole < len(original):
+            self._carry = (original[whole:].copy(), modified[whole:].copy())
+            self._carry_changed = changed
+
+        step = self.CHUNK_FRAMES * width
+
+        for i in range(0, whole, step):
+            end = min(i + step, whole)
+            self._add(original[i:end], modified[i:end], changed)
+
+    def _add(self, original: np.ndarray, modified: np.ndarray, changed: bool):
+        frames = min(len(original) // self.info.frame_width, self.frames - self.seen)
+
+        if frames <= 0:
+            return
+
+        size = frames * self.info.frame_width
+        self.seen += frames
+
+        samples2 = _mono_samples(modified[:size], self.info)
+        normalized = samples2.astype(np.float64) / _max_value(self.info)
+        self.power += float(np.dot(normalized, normalized))
+
+        if changed:
+            samples1 = _mono_samples(original[:size], self.info)
+            difference = (samples2 - samples1).astype(np.float64) / _max_value(
+                self.info
+            )
+            self.error += float(np.dot(difference, difference))
+
+    def value(self) -> float:
+        """
+        PSNR value in dB of the blocks added so far
+        """
+        if self.error == 0:
             return float("inf")
-        else:
-            # Handle negative values which can occur due to numerical precision
-            return float("nan")
 
-    psnr = 10 * math.log10(numerator / denominator)
+        return 10 * math.log10(self.power / self.error)
+
+
+def calculate_pcm_psnr(data1: np.ndarray, data2: np.ndarray, info: WavInfo):
+    """
+    Calculate PSNR between two PCM buffers sharing the same format.
+
+    Args:
+        data1: PCM data of the original audio
+        data2: PCM data of the modified audio
+        info: Format of both buffers
+
+    Returns:
+        PSNR value in dB
+    """
+    size = min(len(data1), len(data2))
+    accumulator = PsnrAccumulator(info._replace(data_size=size))
+    accumulator.update(data1[:size], data2[:size])
+    return accumulator.value()
+
+
+def calculate_psnr(wav_bytes1: bytes, wav_bytes2: bytes):
+    """
+    Calculate PSNR between two WAV files provided as bytes data.
+
+    Args:
+        wav_bytes1: Bytes data of the first WAV file
+        wav_bytes2: Bytes data of the second WAV file
+
+    Returns:
+        PSNR value in dB
+    """
+    info1 = clip_wav_info(read_wav_info(io.BytesIO(wav_bytes1)), len(wav_bytes1))
+    info2 = clip_wav_info(read_wav_info(io.BytesIO(wav_bytes2)), len(wav_bytes2))
+
+    # Check if sample rates match
+    if info1.sample_rate != info2.sample_rate:
+        raise ValueError(
+            f"Sample rates do not match: {info1.sample_rate} vs {info2.sample_rate}"
+        )
 
-    return psnr
+    return calculate_pcm_psnr(
+        pcm_view(wav_bytes1, info1), pcm_view(wav_bytes2, info2), info1
+    )
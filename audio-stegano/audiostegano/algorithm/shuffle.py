@@ -1,37 +1,92 @@
 import random
+import numpy as np
 
 
-def shuffle(data: str, seed: int) -> str:
-    ls = list(data)
-    random.seed(seed)
-    random.shuffle(ls)
-    return "".join(ls)
+def permutation(n: int, seed: int) -> np.ndarray:
+    """
+    Index permutation of n elements, drawn from a PCG64 generator owned by the call.
+    """
+    return np.random.Generator(np.random.PCG64(seed)).permutation(n)
 
 
-def shuffle_arr(data: list, seed: int) -> list:
-    random.seed(seed)
-    random.shuffle(data)
-    return data
+def legacy_permutation(n: int, seed: int) -> np.ndarray:
+    """
+    Index permutation of n elements matching the former random.seed + random.shuffle
+    implementation, kept to read files written with it.
+    """
+    perm = list(range(n))
+    random.Random(seed).shuffle(perm)
+    return np.array(perm, dtype=np.intp)
 
 
-def unshuffle(data: str, seed: int):
-    ls_raw = list(data)
-    n = len(ls_raw)
-    # Perm is [1, 2, ..., n]
-    perm = [i for i in range(1, n + 1)]
-    # Apply sigma to perm
-    shuffled_perm = shuffle_arr(perm, seed)
-    # Zip and unshuffle
-    zipped_ls = list(zip(ls_raw, shuffled_perm))
-    zipped_ls.sort(key=lambda x: x[1])
-    return "".join([a for (a, b) in zipped_ls])
+def _permutation(n: int, seed: int, legacy: bool) -> np.ndarray:
+    if legacy:
+        return legacy_permutation(n, seed)
+    return permutation(n, seed)
+
+
+def shuffle(data: np.ndarray, seed: int, legacy: bool = False) -> np.ndarray:
+    """
+    Shuffles data: element i of the result is data[perm[i]].
+    """
+    return data[_permutation(len(data), seed, legacy)]
+
+
+def unshuffle(data: np.ndarray, seed: int, legacy: bool = False) -> np.ndarray:
+    """
+    Reverts shuffle by scattering every element back to its original position.
+    """
+    result = np.empty_like(data)
+    result[_permutation(len(data), seed, legacy)] = data
+    return result
+
+
+def inverse_permutation(n: int, seed: int, legacy: bool = False) -> np.ndarray:
+    """
+    Position in the shuffled data of every element of the original data.
+    """
+    perm = _permutation(n, seed, legacy)
+    inverse = np.empty_like(perm)
+    inverse[perm] = np.arange(n)
+    return inverse
+
+
+# Number of elements shuffled together in block shuffle mode
+SHUFFLE_BLOCK = 1 << 20
+
+
+def block_permutation(n: int, seed: int, index: int) -> np.ndarray:
+    """
+    Index permutation of the n elements of block index, drawn from a PCG64
+    generator seeded with both the seed and the block index, so every block
+    can be shuffled on its own.
+    """
+    sequence = np.random.SeedSequence([seed, index])
+    return np.random.Generator(np.random.PCG64(sequence)).permutation(n)
+
+
+def shuffle_block(data: np.ndarray, seed: int, index: int) -> np.ndarray:
+    return data[block_permutation(len(data), seed, index)]
+
+
+def unshuffle_block(data: np.ndarray, seed: int, index: int) -> np.ndarray:
+    result = np.empty_like(data)
+    result[block_permutation(len(data), seed, index)] = data
+    return result
+
+
+def inverse_block_permutation(n: int, seed: int, index: int) -> np.ndarray:
+    perm = block_permutation(n, seed, index)
+    inverse = np.empty_like(perm)
+    inverse[perm] = np.arange(n)
+    return inverse
 
 
 # if __name__ == "__main__":
 #     seed = 1
-#     data = "Hello, World!"
-#     print(f"Data: {data}")
+#     data = np.frombuffer(b"Hello, World!", dtype=np.uint8)
+#     print(f"Data: {data.tobytes()}")
 #     shuffled = shuffle(data, seed)
-#     print(f"Shuffled: {shuffled}")
+#     print(f"Shuffled: {shuffled.tobytes()}")
 #     unshuffled = unshuffle(shuffled, seed)
-#     print(f"Unshuffled: {unshuffled}")
+#     print(f"Unshuffled: {unshuffled.tobytes()}")
@@ -1,37 +1,69 @@
-def encrypt(data: bytearray, key: str) -> bytearray:
-    """
-    Encrypts plaintext using the extended Vigenère cipher with the given key.
-    """
-    cipher: list[int] = []
-    key_length = len(key)
+import numpy as np
+
 
-    for i in range(len(data)):
-        p = data[i]
-        k = ord(key[i % key_length])
+def _key_vector(key: str) -> np.ndarray:
+    if len(key) == 0:
+        raise ValueError("Key cannot be empty.")
 
-        c = (p + k) % 256
+    # Only the key value modulo 256 matters for the result
+    return np.array([ord(ch) % 256 for ch in key], dtype=np.uint8)
 
-        cipher.append(c)
 
-    return bytearray(cipher)
+def _key_stream(key_vector: np.ndarray, offset: int, length: int) -> np.ndarray:
+    """
+    The key tiled over length bytes, starting at position offset of the message.
+    """
+    return np.resize(np.roll(key_vector, -(offset % len(key_vector))), length)
 
 
-def decrypt(cipher: bytearray, key: str) -> bytearray:
+class VigenereCipher:
     """
-    Decrypts ciphertext using the extended Vigenère cipher with the given key.
+    Incremental extended Vigenère cipher.
+
+    Keeps track of the position in the key across calls, so a message can be
+    processed chunk by chunk and give the same result as a single
+    encrypt/decrypt call over the whole message.
     """
-    plain: list[int] = []
-    key_length = len(key)
 
-    for i in range(len(cipher)):
-        c = cipher[i]
-        k = ord(key[i % key_length])
+    def __init__(self, key: str, offset: int = 0):
+        self.key_vector = _key_vector(key)
+        self.offset = offset
+
+    def _apply(self, chunk: bytes, sign: int) -> np.ndarray:
+        data = np.frombuffer(chunk, dtype=np.uint8)
+        stream = _key_stream(self.key_vector, self.offset, len(data))
+        self.offset += len(data)
+
+        # uint8 arithmetic wraps around, which is the modulo 256
+        if sign > 0:
+            return data + stream
+        return data - stream
 
-        p = (c - k) % 256
+    def encrypt(self, chunk: bytes) -> bytes:
+        """
+        Encrypts the next chunk of plaintext.
+        """
+        return self._apply(chunk, 1).tobytes()
 
-        plain.append(p)
+    def decrypt(self, chunk: bytes) -> bytes:
+        """
+        Decrypts the next chunk of ciphertext.
+        """
+        return self._apply(chunk, -1).tobytes()
 
-    return bytearray(plain)
+
+def encrypt(data: bytearray, key: str) -> bytearray:
+    """
+    Encrypts plaintext using the extended Vigenère cipher with the given key.
+    """
+    return bytearray(VigenereCipher(key)._apply(data, 1))
+
+
+def decrypt(cipher: bytearray, key: str) -> bytearray:
+    """
+    Decrypts ciphertext using the extended Vigenère cipher with the given key.
+    """
+    return bytearray(VigenereCipher(key)._apply(cipher, -1))
 
 
 # if __name__ == "__main__":
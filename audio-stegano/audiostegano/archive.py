@@ -0,0 +1,114 @@
+import os
+import struct
+import zlib
+from typing import Callable, Iterator, NamedTuple
+from audiostegano.algorithm.compress import NONE, compress, iter_decompress
+
+# An archive payload is laid out as:
+#   index size (>I), member count (>I)
+#   for every member: name length (>H), name, codec (>B), offset (>I),
+#                     stored length (>I), original size (>I), CRC32 (>I)
+#   member data, offsets are relative to the end of the index
+INDEX_HEADER = struct.Struct(">II")
+ENTRY = struct.Struct(">BIIII")
+NAME_LENGTH = struct.Struct(">H")
+
+# Amount of a member read from the audio at once when extracting it
+READ_SIZE = 1 << 16
+
+# Reads length bytes of the payload from offset
+ReadAt = Callable[[int, int], bytes]
+
+
+class ArchiveEntry(NamedTuple):
+    name: str
+    codec: int  # compression codec of the stored data, see algorithm/compress.py
+    offset: int  # position of the stored data after the index
+    length: int  # length of the stored data
+    size: int  # length of the original file
+    crc32: int  # CRC32 of the original file
+
+
+def pack_archive(paths: list[str], compress_members: bool = False) -> bytes:
+    """
+    Build an archive payload holding the files at paths, under their base names.
+
+    With compress_members, every member is compressed on its own with the best
+    codec for it, so it can still be extracted without the other members.
+    """
+    names = [os.path.basename(path) for path in paths]
+
+    if len(set(names)) != len(names):
+        raise ValueError("Archive members must have distinct file names.")
+
+    index = bytearray()
+    data = bytearray()
+
+    for name, path in zip(names, paths):
+        with open(path, "rb") as f:
+            content = f.read()
+
+        codec, stored = NONE, content
+
+        if compress_members:
+            codec, stored = compress(content)
+
+        name_bytes = name.encode("ascii")
+        index += NAME_LENGTH.pack(len(name_bytes)) + name_bytes
+        index += ENTRY.pack(
+            codec, len(data), len(stored), len(content), zlib.crc32(content)
+        )
+        data += stored
+
+    return INDEX_HEADER.pack(len(index) + 4, len(paths)) + index + data
+
+
+def read_index(read_at: ReadAt) -> tuple[list[ArchiveEntry], int]:
+    """
+    Parse the index of an archive payload.
+
+    Returns the members and the position of the member data in the payload.
+    """
+    index_size, count = INDEX_HEADER.unpack(read_at(0, INDEX_HEADER.size))
+    data_start = 4 + index_size
+    index = read_at(INDEX_HEADER.size, index_size - 4)
+    entries = []
+    position = 0
+
+    try:
+        for _ in range(count):
+            (name_length,) = NAME_LENGTH.unpack_from(index, position)
+            position += NAME_LENGTH.size
+            name = index[position : position + name_length].decode("ascii")
+            position += name_length
+            entries.append(ArchiveEntry(name, *ENTRY.unpack_from(index, position)))
+            position += ENTRY.size
+    except (struct.error, UnicodeDecodeError):
+        raise ValueError("The archive index is corrupted.")
+
+    return entries, data_start
+
+
+def iter_member(
+    read_at: ReadAt, entry: ArchiveEntry, data_start: int
+) -> Iterator[bytes]:
+    """
+    Read, decompress and verify a member chunk by chunk.
+    """
+
+    def stored() -> Iterator[bytes]:
+        start = data_start + entry.offset
+
+        for i in range(0, entry.length, READ_SIZE):
+            yield read_at(start + i, min(READ_SIZE, entry.length - i))
+
+    crc = 0
+    size = 0
+
+    for chunk in iter_decompress(stored(), entry.codec):
+        crc = zlib.crc32(chunk, crc)
+        size += len(chunk)
+        yield chunk
+
+    if size != entry.size or crc != entry.crc32:
+        raise ValueError(f"Checksum mismatch for archive member {entry.name}.")
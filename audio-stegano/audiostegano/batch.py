@@ -0,0 +1,212 @@
+import contextlib
+import csv
+import io
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Iterator
+from audiostegano.stegano import perform_encode, perform_decode
+from audiostegano.input import cache
+from audiostegano.input.cache import configure_cache
+
+# Columns of a manifest row, every one but carrier is optional
+FIELDS = (
+    "command",
+    "carrier",
+    "message",
+    "output",
+    "key",
+    "shuffle",
+    "block_shuffle",
+    "depth",
+    "sample_lsb",
+    "compress",
+    "stream",
+)
+
+MAX_KEY_LENGTH = 25
+
+
+def _flag(value) -> bool:
+    if isinstance(value, str):
+        return value.strip().lower() in ("1", "true", "yes", "y")
+    return bool(value)
+
+
+def _optional(value) -> str | None:
+    if value is None or value == "":
+        return None
+    return str(value)
+
+
+def load_manifest(path: str) -> list[dict]:
+    """
+    Read the jobs of a batch manifest.
+
+    .jsonl and .json files hold one JSON object per line, anything else is read
+    as a CSV file with a header row. Both use the column names of FIELDS, the
+    command defaults to encode.
+    """
+    with open(path, "r", newline="") as f:
+        if path.endswith((".jsonl", ".json")):
+            rows = [json.loads(line) for line in f if line.strip()]
+        else:
+            rows = list(csv.DictReader(f))
+
+    jobs = []
+
+    for row in rows:
+        unknown = set(row) - set(FIELDS)
+
+        if unknown:
+            raise ValueError(f"Unknown manifest columns: {', '.join(sorted(unknown))}")
+
+        jobs.append({field: row.get(field) for field in FIELDS})
+
+    return jobs
+
+
+def run_job(job: dict) -> dict:
+    """
+    Run a single manifest job and report how it went instead of raising.
+
+    What the job prints is captured so parallel jobs do not interleave their
+    output on the console.
+    """
+    log = io.StringIO()
+    before = cache.carrier_cache.stats()
+    start = time.perf_counter()
+    error = None
+
+    try:
+        with contextlib.redirect_stdout(log):
+            _perform(job)
+    except Exception as e:
+        error = str(e)
+
+    return {
+        "command": job.get("command") or "encode",
+        "carrier": job.get("carrier"),
+        "output": job.get("output"),
+        "status": "ok" if error is None else "error",
+        "error": error,
+        "seconds": round(time.perf_counter() - start, 6),
+        "cache": _cache_outcome(before, cache.carrier_cache.stats()),
+        "log": log.getvalue(),
+    }
+
+
+def _cache_outcome(before: dict, after: dict) -> str | None:
+    """
+    How the carrier of a job was found in the cache, None for WAV carriers
+    which are never decoded.
+    """
+    for outcome in ("hits", "disk_hits", "misses"):
+        if after[outcome] > before[outcome]:
+            return outcome[:-1]
+
+    return None
+
+
+def _perform(job: dict):
+    command = job.get("command") or "encode"
+    carrier = _optional(job.get("carrier"))
+    output = _optional(job.get("output"))
+    key = _optional(job.get("key"))
+
+    if carrier is None:
+        raise ValueError("No carrier file given.")
+
+    if key is not None and len(key) > MAX_KEY_LENGTH:
+        raise ValueError(f"Key must be at most {MAX_KEY_LENGTH} characters long")
+
+    if command == "encode":
+        message = _optional(job.get("message"))
+
+        if message is None or output is None:
+            raise ValueError("Encoding needs a message and an output file.")
+
+        perform_encode(
+            carrier,
+            message,
+            output,
+            _flag(job.get("shuffle")),
+            key,
+            _flag(job.get("stream")),
+            depth=int(job.get("depth") or 1),
+            sample_lsb=_flag(job.get("sample_lsb")),
+            compress=_flag(job.get("compress")),
+            block_shuffle=_flag(job.get("block_shuffle")),
+        )
+    elif command == "decode":
+        perform_decode(carrier, output, key, _flag(job.get("stream")))
+    else:
+        raise ValueError(f"Unknown command '{command}'.")
+
+
+def iter_batch(
+    jobs: list[dict],
+    workers: int | None = None,
+    cache_size: int | None = None,
+    cache_dir: str | None = None,
+    cache_dir_size: int | None = None,
+) -> Iterator[dict]:
+    """
+    Run jobs on a pool of worker processes, yielding their results as they finish.
+
+    Results carry the index of their job in the manifest. Every worker keeps
+    its own carrier cache of cache_size bytes, all spilling to cache_dir,
+    which is kept under cache_dir_size bytes.
+    """
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=configure_cache,
+        initargs=(cache_size, cache_dir, cache_dir_size),
+    ) as pool:
+        futures = {pool.submit(run_job, job): i for i, job in enumerate(jobs)}
+
+        for future in as_completed(futures):
+            yield {"index": futures[future], **future.result()}
+
+
+def run_batch(
+    manifest_path: str,
+    summary_path: str,
+    workers: int | None = None,
+    cache_size: int | None = None,
+    cache_dir: str | None = None,
+    cache_dir_size: int | None = None,
+) -> tuple[int, int]:
+    """
+    Run every job of a manifest and write one JSON line per finished job to
+    summary_path. A failing job does not stop the others.
+
+    Returns the number of succeeded and failed jobs.
+    """
+    jobs = load_manifest(manifest_path)
+    succeeded = failed = 0
+    start = time.perf_counter()
+
+    print(f"Running {len(jobs)} jobs on {workers or os.cpu_count()} workers")
+
+    with open(summary_path, "w") as summary:
+        for result in iter_batch(jobs, workers, cache_size, cache_dir, cache_dir_size):
+            summary.write(json.dumps(result) + "\n")
+            summary.flush()
+
+            if result["status"] == "ok":
+                succeeded += 1
+                print(
+                    f"[{result['index']}] {result['carrier']}: ok ({result['seconds']:.2f}s)"
+                )
+            else:
+                failed += 1
+                print(
+                    f"[{result['index']}] {result['carrier']}: Error: {result['error']}"
+                )
+
+    elapsed = time.perf_counter() - start
+    print(f"{succeeded} succeeded, {failed} failed in {elapsed:.2f}s")
+
+    return succeeded, failed
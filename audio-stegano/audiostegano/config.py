@@ -1,3 +1,27 @@
 ENCRYPTED = 1
 
 RANDOM_SHUFFLE = 2
+
+# Shuffle permutation is drawn from NumPy's PCG64 instead of the stdlib random module
+PCG_SHUFFLE = 4
+
+# Message bits only go in the least significant byte of every PCM sample
+SAMPLE_LSB = 8
+
+# Number of LSBs used per carrier byte for the message, stored minus one (1-4)
+DEPTH_SHIFT = 8
+DEPTH_MASK = 0b11 << DEPTH_SHIFT
+
+# Codec the payload was compressed with before encryption, see algorithm/compress.py
+CODEC_SHIFT = 10
+CODEC_MASK = 0b11 << CODEC_SHIFT
+
+# Payload is an archive of several files with an index, see archive.py
+ARCHIVE = 1 << 12
+
+# Header is followed by a tag of its fields (keyed when encrypted) and the
+# payload carries a CRC32 after every block, see algorithm/checksum.py
+CHECKSUM = 1 << 13
+
+# Message bits are shuffled within fixed-size blocks, each with its own permutation
+BLOCK_SHUFFLE = 1 << 14
@@ -0,0 +1,257 @@
+import hashlib
+import io
+import os
+import shutil
+import threading
+from collections import OrderedDict
+from typing import Any, BinaryIO, Callable
+from audiostegano.input.wav import WavInfo, read_wav_info, clip_wav_info, map_wav
+
+# Default in-memory budget for decoded carriers
+MAX_BYTES = 256 << 20
+
+# Default disk budget of the spill directory
+MAX_SPILL_BYTES = 4 << 30
+
+# Amount of a carrier hashed at once
+HASH_CHUNK = 1 << 20
+
+# Number of file hashes remembered, least recently used ones are forgotten first
+MAX_HASHES = 4096
+
+
+def content_hash(path: str) -> str:
+    h = hashlib.sha256()
+
+    with open(path, "rb") as f:
+        while chunk := f.read(HASH_CHUNK):
+            h.update(chunk)
+
+    return h.hexdigest()
+
+
+class CarrierCache:
+    """
+    LRU cache of carriers decoded to WAV, keyed by the hash of the carrier content.
+
+    Entries are kept in memory up to max_bytes. With a spill_dir, decoded
+    carriers are also written there as WAV files, which outlive the process and
+    are memory-mapped back on a miss. The spill directory is kept under
+    max_spill_bytes by removing the least recently used files first, using
+    their mtime, which is bumped on every use, so it can be shared between
+    processes. Hashes are remembered per path, size and mtime so unchanged
+    files are not hashed again, up to MAX_HASHES files.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = MAX_BYTES,
+        spill_dir: str | None = None,
+        max_spill_bytes: int = MAX_SPILL_BYTES,
+    ):
+        self.max_bytes = max_bytes
+        self.spill_dir = spill_dir
+        self.max_spill_bytes = max_spill_bytes
+        self.size = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[str, tuple[WavInfo, bytes]] = OrderedDict()
+        self._hashes: OrderedDict[tuple[str, int, int], str] = OrderedDict()
+        self._lock = threading.Lock()
+
+        if spill_dir is not None:
+            os.makedirs(spill_dir, exist_ok=True)
+
+    def key(self, path: str) -> str:
+        stat = os.stat(path)
+        stamp = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+
+        with self._lock:
+            if stamp in self._hashes:
+                self._hashes.move_to_end(stamp)
+                return self._hashes[stamp]
+
+        # Hashed outside the lock, other threads keep using the cache meanwhile
+        key = content_hash(path)
+
+        with self._lock:
+            self._hashes[stamp] = key
+
+            while len(self._hashes) > MAX_HASHES:
+                self._hashes.popitem(last=False)
+
+        return key
+
+    def _spill_path(self, key: str) -> str:
+        return os.path.join(self.spill_dir, f"{key}.wav")
+
+    def lookup(self, path: str) -> tuple[str, tuple[WavInfo, Any] | None]:
+        """
+        Find the decoded carrier of path, in memory first and then on disk.
+
+        Returns the key of the carrier and its format and WAV buffer, or None
+        when it has not been decoded yet.
+        """
+        key = self.key(path)
+
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return key, self._entries[key]
+
+        spilled = self._map_spilled(key)
+
+        if spilled is not None:
+            with self._lock:
+                self.disk_hits += 1
+
+            return key, spilled
+
+        with self._lock:
+            self.misses += 1
+
+        return key, None
+
+    def _map_spilled(self, key: str) -> tuple[WavInfo, Any] | None:
+        if self.spill_dir is None:
+            return None
+
+        path = self._spill_path(key)
+
+        try:
+            spilled = map_wav(path)
+        except FileNotFoundError:
+            # Never spilled, or removed by another process
+            return None
+
+        try:
+            # Marks the file as recently used, see _trim_spill
+            os.utime(path)
+        except OSError:
+            pass
+
+        return spilled
+
+    def _spill(self, key: str, write: Callable[[BinaryIO], Any], size: int):
+        if self.spill_dir is None or size > self.max_spill_bytes:
+            return
+
+        path = self._spill_path(key)
+
+        if os.path.isfile(path):
+            return
+
+        # Written under a temporary name so other processes never map a partial file
+        partial = f"{path}.{os.getpid()}.{threading.get_ident()}.part"
+
+        with open(partial, "wb") as f:
+            write(f)
+
+        os.replace(partial, path)
+        self._trim_spill(path, size)
+
+    def _trim_spill(self, kept: str, size: int):
+        """
+        Remove the least recently used spilled carriers beyond the disk budget,
+        except kept which was just written.
+        """
+        files = []
+        total = size
+
+        for entry in os.scandir(self.spill_dir):
+            if not entry.name.endswith(".wav") or entry.path == kept:
+                continue
+
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+
+            files.append((stat.st_mtime_ns, stat.st_size, entry.path))
+            total += stat.st_size
+
+        for _, file_size, path in sorted(files):
+            if total <= self.max_spill_bytes:
+                break
+
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except OSError:
+                # Still mapped by a process on platforms that forbid removing it
+                continue
+
+            total -= file_size
+
+    def store(self, key: str, wav_bytes: bytes) -> tuple[WavInfo, bytes]:
+        """
+        Add a carrier decoded to WAV, evicting the least recently used ones
+        beyond the memory budget. Returns its format and WAV buffer.
+        """
+        info = clip_wav_info(read_wav_info(io.BytesIO(wav_bytes)), len(wav_bytes))
+        entry = (info, wav_bytes)
+
+        self._spill(key, lambda f: f.write(wav_bytes), len(wav_bytes))
+
+        if len(wav_bytes) > self.max_bytes:
+            return entry
+
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = entry
+                self.size += len(wav_bytes)
+
+            while self.size > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+
+        return entry
+
+    def store_file(self, key: str, wav_file: BinaryIO):
+        """
+        Add a carrier decoded to a WAV file. It is only read into memory when
+        it fits the memory budget, otherwise it is just copied to the spill
+        directory. The file is left at its start.
+        """
+        wav_file.seek(0, io.SEEK_END)
+        size = wav_file.tell()
+        wav_file.seek(0)
+
+        if size <= self.max_bytes:
+            self.store(key, wav_file.read())
+        else:
+            self._spill(key, lambda f: shutil.copyfileobj(wav_file, f), size)
+
+        wav_file.seek(0)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "entries": len(self._entries),
+                "bytes": self.size,
+            }
+
+
+carrier_cache = CarrierCache()
+
+
+def configure_cache(
+    max_bytes: int | None = None,
+    spill_dir: str | None = None,
+    max_spill_bytes: int | None = None,
+):
+    """
+    Replace the carrier cache of this process, also used to set up worker processes.
+    """
+    global carrier_cache
+    carrier_cache = CarrierCache(
+        MAX_BYTES if max_bytes is None else max_bytes,
+        spill_dir,
+        MAX_SPILL_BYTES if max_spill_bytes is None else max_spill_bytes,
+    )
@@ -1,29 +1,220 @@
+from contextlib import contextmanager
+from typing import BinaryIO, Iterator
 from pydub import AudioSegment
+from pydub.utils import mediainfo_json
+import numpy as np
 import io
+import mmap
+import os
+import tempfile
+from audiostegano.input.wav import (
+    WavInfo,
+    read_wav_info,
+    clip_wav_info,
+    map_wav,
+    pcm_view,
+    wav_header,
+)
+from audiostegano.input import cache
 
+# Amount of PCM data read at once when streaming a carrier
+BLOCK_SIZE = 1 << 20
 
-def load_audio_file(path: str) -> bytes:
+
+def load_audio_file(path: str) -> tuple[bytes, np.ndarray, WavInfo]:
+    """
+    Load any audio file as WAV header and PCM data
+
+    PCM WAV files are memory-mapped and their data is returned as a zero-copy
+    view. Other formats are decoded with pydub and converted to WAV in memory,
+    going through the carrier cache so a carrier is only decoded once.
+
+    Args:
+        path (str): Path to the input audio file
+
+    Returns:
+        bytes: WAV header, up to the start of the PCM data
+        np.ndarray: PCM data as a uint8 array
+        WavInfo: Format of the PCM data
     """
-    Load any audio file and convert it to WAV format in memory
+    try:
+        info, mm = map_wav(path)
+    except ValueError:
+        key, cached = cache.carrier_cache.lookup(path)
+
+        if cached is None:
+            cached = cache.carrier_cache.store(key, _decode_to_wav(path).getvalue())
+
+        info, buffer = cached
+        return wav_header(buffer, info), pcm_view(buffer, info), info
+
+    return wav_header(mm, info), pcm_view(mm, info), info
+
+
+def probe_audio_info(path: str) -> WavInfo:
+    """
+    Format and PCM data size of any audio file, without reading its samples
+
+    Only the RIFF chunk headers of PCM WAV files are read. Other formats are
+    probed through their container metadata, giving the format pydub decodes
+    them to and an estimate of the data size from the stream duration.
 
     Args:
         path (str): Path to the input audio file
 
     Returns:
-        bytes: WAV file as bytes
+        WavInfo: Format of the PCM data, data_offset is 0 for non-WAV files
+    """
+    with open(path, "rb") as f:
+        try:
+            info = read_wav_info(f)
+        except ValueError:
+            info = None
+
+        if info is not None:
+            return clip_wav_info(info, os.fstat(f.fileno()).st_size)
+
+    probe = mediainfo_json(path)
+    streams = [s for s in probe.get("streams", []) if s.get("codec_type") == "audio"]
+
+    if not streams:
+        raise ValueError("The file has no audio stream.")
+
+    stream = streams[0]
+
+    # Same sample width selection as AudioSegment.from_file
+    if stream.get("sample_fmt") == "fltp" and stream.get("codec_name") in (
+        "mp3",
+        "mp4",
+        "aac",
+        "webm",
+        "ogg",
+    ):
+        bits = 16
+    else:
+        bits = int(stream.get("bits_per_sample") or 16)
+
+    channels = int(stream["channels"])
+    sample_rate = int(stream["sample_rate"])
+    duration = float(stream.get("duration") or probe["format"]["duration"])
+
+    frames = int(duration * sample_rate)
+    sample_width = bits // 8
+
+    return WavInfo(
+        channels, sample_rate, sample_width, 0, frames * channels * sample_width
+    )
+
+
+def _decode_to_wav(path: str, out: BinaryIO | None = None) -> BinaryIO:
+    """
+    Decode any audio file with pydub and write it as WAV to out (in memory by default)
     """
     audio: AudioSegment = AudioSegment.from_file(path)
-    wav_io = io.BytesIO()
+    wav_io = out if out is not None else io.BytesIO()
     audio.export(wav_io, format="wav")
     wav_io.seek(0)
-    wav_bytes = wav_io.getvalue()
+    return wav_io
+
+
+@contextmanager
+def open_audio_stream(path: str) -> Iterator[tuple[bytes, WavInfo, BinaryIO]]:
+    """
+    Open any audio file for block-wise reading of its PCM data
+
+    PCM WAV files are read in place. Other formats go through the carrier
+    cache: a cached carrier is read from memory or from its spill file, and on
+    a miss the carrier is decoded once with pydub to a temporary WAV file on
+    disk, added to the cache and read the same way.
 
-    header = wav_bytes[:44]
-    data = wav_bytes[44:]
+    Args:
+        path (str): Path to the input audio file
+
+    Yields:
+        bytes: WAV header, up to the start of the PCM data
+        WavInfo: Format of the PCM data
+        BinaryIO: File positioned at the start of the PCM data
+    """
+    with open(path, "rb") as f:
+        try:
+            info = read_wav_info(f)
+        except ValueError:
+            info = None
+
+        if info is not None:
+            yield _stream_parts(f, info)
+            return
+
+    key, cached = cache.carrier_cache.lookup(path)
+
+    if cached is not None:
+        info, buffer = cached
+        # mmap objects are read like files, BytesIO shares bytes without copying
+        f = buffer if isinstance(buffer, mmap.mmap) else io.BytesIO(buffer)
+        yield _stream_parts(f, info)
+        return
+
+    with tempfile.TemporaryFile() as spill:
+        _decode_to_wav(path, spill)
+        cache.carrier_cache.store_file(key, spill)
+        yield _stream_parts(spill, read_wav_info(spill))
+
+
+def _stream_parts(f: BinaryIO, info: WavInfo) -> tuple[bytes, WavInfo, BinaryIO]:
+    f.seek(0, io.SEEK_END)
+    info = clip_wav_info(info, f.tell())
+
+    f.seek(0)
+    header = wav_header(f.read(info.data_offset), info)
+
+    return header, info, f
+
+
+def map_audio_stream(f: BinaryIO, info: WavInfo) -> np.ndarray:
+    """
+    Zero-copy uint8 view over the PCM data of a file opened by open_audio_stream
+    """
+    if isinstance(f, io.BytesIO):
+        buffer = f.getbuffer()
+    elif isinstance(f, mmap.mmap):
+        buffer = f
+    else:
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
 
-    return header, data
+    return pcm_view(buffer, info)
+
+
+def read_blocks(
+    f: BinaryIO, info: WavInfo, block_size: int = BLOCK_SIZE
+) -> Iterator[bytes]:
+    """
+    Read the PCM data of a file in chunks of about block_size bytes
+
+    Chunks always hold whole frames.
+    """
+    block_size = max(1, block_size // info.frame_width) * info.frame_width
+    remaining = info.data_size
+
+    while remaining > 0:
+        block = f.read(min(block_size, remaining))
+
+        if not block:
+            break
+
+        remaining -= len(block)
+
+        yield block
 
 
 def save_from_bytes(data: bytes, path: str):
     with open(path, "wb") as w:
         w.write(data)
+
+
+def save_wav(header: bytes, data: np.ndarray | bytes, path: str):
+    """
+    Write a WAV file from its header and PCM data without joining them in memory
+    """
+    with open(path, "wb") as w:
+        w.write(header)
+        w.write(data)
@@ -0,0 +1,149 @@
+import mmap
+import struct
+from typing import BinaryIO, NamedTuple
+import numpy as np
+
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+
+class WavInfo(NamedTuple):
+    channels: int
+    sample_rate: int
+    sample_width: int  # bytes per sample
+    data_offset: int  # position of the first PCM byte in the file
+    data_size: int  # number of PCM bytes
+
+    @property
+    def frame_width(self) -> int:
+        return self.channels * self.sample_width
+
+
+def read_wav_info(f: BinaryIO) -> WavInfo:
+    """
+    Walk the RIFF chunks of a WAV file until the data chunk is found.
+
+    Chunks other than fmt and data (LIST, fact, ...) are skipped. Only PCM
+    encoded files are accepted, everything else raises a ValueError.
+
+    Args:
+        f (BinaryIO): File positioned at the start of the RIFF header
+
+    Returns:
+        WavInfo: Format of the samples and location of the data chunk
+    """
+    riff = f.read(12)
+
+    if len(riff) < 12 or riff[:4] != b"RIFF" or riff[8:12] != b"WAVE":
+        raise ValueError("Not a RIFF/WAVE file.")
+
+    position = 12
+    fmt = None
+
+    while True:
+        chunk_header = f.read(8)
+
+        if len(chunk_header) < 8:
+            raise ValueError("The WAV file has no data chunk.")
+
+        chunk_id, chunk_size = struct.unpack("<4sI", chunk_header)
+        position += 8
+
+        if chunk_id == b"fmt ":
+            body = f.read(chunk_size)
+
+            if len(body) < 16:
+                raise ValueError("The WAV fmt chunk is truncated.")
+
+            format_tag, channels, sample_rate, _, block_align, _ = struct.unpack(
+                "<HHIIHH", body[:16]
+            )
+
+            # The actual format of an extensible file is the head of its sub format GUID
+            if format_tag == WAVE_FORMAT_EXTENSIBLE and len(body) >= 26:
+                format_tag = struct.unpack("<H", body[24:26])[0]
+
+            if channels == 0 or block_align < channels:
+                raise ValueError("The WAV fmt chunk is invalid.")
+
+            if format_tag != WAVE_FORMAT_PCM:
+                raise ValueError(f"Unsupported WAV format tag {format_tag:#06x}.")
+
+            fmt = (channels, sample_rate, block_align // channels)
+        elif chunk_id == b"data":
+            if fmt is None:
+                raise ValueError("The WAV data chunk comes before the fmt chunk.")
+
+            return WavInfo(*fmt, position, chunk_size)
+
+        # Chunks are word aligned
+        position += chunk_size + (chunk_size & 1)
+        f.seek(position)
+
+
+def wav_header(raw: bytes, info: WavInfo) -> bytes:
+    """
+    Everything in front of the PCM data, with the RIFF and data chunk sizes
+    fixed up so the file ends right after info.data_size bytes of PCM data.
+    """
+    header = bytearray(raw[: info.data_offset])
+    struct.pack_into("<I", header, 4, info.data_offset + info.data_size - 8)
+    struct.pack_into("<I", header, info.data_offset - 4, info.data_size)
+    return bytes(header)
+
+
+def map_wav(path: str) -> tuple[WavInfo, mmap.mmap]:
+    """
+    Memory-map a PCM WAV file for read-only access.
+
+    The data size is clipped to the file length, see clip_wav_info.
+    """
+    with open(path, "rb") as f:
+        info = read_wav_info(f)
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    return clip_wav_info(info, len(mm)), mm
+
+
+def clip_wav_info(info: WavInfo, file_size: int) -> WavInfo:
+    """
+    Clip the data size to whole frames actually present in a file of file_size
+    bytes. This also covers writers leaving a placeholder size in the data chunk.
+    """
+    data_size = max(0, min(info.data_size, file_size - info.data_offset))
+    return info._replace(data_size=data_size - data_size % info.frame_width)
+
+
+def pcm_view(buffer, info: WavInfo) -> np.ndarray:
+    """
+    Zero-copy uint8 view over the PCM data of a mapped or in-memory WAV file.
+    """
+    return np.frombuffer(
+        buffer, dtype=np.uint8, count=info.data_size, offset=info.data_offset
+    )
+
+
+def pcm_samples(data: np.ndarray, info: WavInfo) -> np.ndarray:
+    """
+    Signed sample values of PCM data, as an int64 array of shape (frames, channels).
+
+    8-bit samples are stored unsigned and are re-centered around zero.
+    """
+    width = info.sample_width
+    frames = np.asarray(data).reshape(-1, info.channels, width)
+
+    if width == 1:
+        samples = frames[..., 0].astype(np.int64) - 128
+    elif width in (2, 4):
+        samples = frames.view(f"<i{width}")[..., 0].astype(np.int64)
+    else:
+        # No native dtype, assemble the little-endian bytes and sign extend
+        samples = np.zeros(frames.shape[:2], dtype=np.int64)
+
+        for i in range(width):
+            samples |= frames[..., i].astype(np.int64) << (8 * i)
+
+        sign = np.int64(1) << (8 * width - 1)
+        samples = (samples ^ sign) - sign
+
+    return samples
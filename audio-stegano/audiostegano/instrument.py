@@ -0,0 +1,192 @@
+import cProfile
+import json
+import time
+import tracemalloc
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Iterator, TextIO
+
+# Receives every finished span as a dict, see Instrument.span
+SpanCallback = Callable[[dict], None]
+
+_current: ContextVar["Instrument | None"] = ContextVar("instrument", default=None)
+
+
+class Instrument:
+    """
+    Collects timing and memory spans of the pipeline stages.
+
+    While active (as a context manager), every span() opened in this context is
+    recorded with its wall time, CPU time, number of bytes processed and, with
+    trace_memory, the peak of memory allocated during the span. Spans are kept
+    in self.spans, passed to callback and written as JSON lines to output.
+    """
+
+    def __init__(
+        self,
+        callback: SpanCallback | None = None,
+        output: TextIO | None = None,
+        trace_memory: bool = True,
+    ):
+        self.callback = callback
+        self.output = output
+        self.trace_memory = trace_memory
+        self.spans: list[dict] = []
+        self._peaks: list[int] = []
+        self._started_tracing = False
+        self._token = None
+
+    def __enter__(self) -> "Instrument":
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+
+        self._token = _current.set(self)
+        return self
+
+    def __exit__(self, *exc):
+        _current.reset(self._token)
+
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    @contextmanager
+    def span(self, name: str, size: int = 0) -> Iterator[dict]:
+        """
+        Record the stage name around the body of the with block. size is the
+        number of bytes the stage processes, it can be updated on the yielded
+        record when only known at the end.
+        """
+        record = {"span": name, "bytes": size}
+        tracing = self.trace_memory and tracemalloc.is_tracing()
+
+        if tracing:
+            # The peak is reset for this span, keep the peak of the enclosing one so far
+            current, peak = tracemalloc.get_traced_memory()
+
+            if self._peaks:
+                self._peaks[-1] = max(self._peaks[-1], peak)
+
+            tracemalloc.reset_peak()
+            self._peaks.append(current)
+            start_memory = current
+
+        wall = time.perf_counter()
+        cpu = time.process_time()
+
+        try:
+            yield record
+        finally:
+            record["wall_s"] = time.perf_counter() - wall
+            record["cpu_s"] = time.process_time() - cpu
+
+            if tracing:
+                peak = max(self._peaks.pop(), tracemalloc.get_traced_memory()[1])
+                record["peak_bytes"] = peak - start_memory
+
+                if self._peaks:
+                    self._peaks[-1] = max(self._peaks[-1], peak)
+
+            self._record(record)
+
+    def _record(self, record: dict):
+        self.spans.append(record)
+
+        if self.callback is not None:
+            self.callback(record)
+
+        if self.output is not None:
+            self.output.write(json.dumps(record) + "\n")
+            self.output.flush()
+
+    def summary(self) -> list[dict]:
+        """
+        Spans added up by name, in order of first appearance.
+        """
+        totals: dict[str, dict] = {}
+
+        for record in self.spans:
+            total = totals.setdefault(
+                record["span"],
+                {
+                    "span": record["span"],
+                    "calls": 0,
+                    "bytes": 0,
+                    "wall_s": 0.0,
+                    "cpu_s": 0.0,
+                },
+            )
+            total["calls"] += 1
+            total["bytes"] += record["bytes"]
+            total["wall_s"] += record["wall_s"]
+            total["cpu_s"] += record["cpu_s"]
+
+            if "peak_bytes" in record:
+                total["peak_bytes"] = max(
+                    total.get("peak_bytes", 0), record["peak_bytes"]
+                )
+
+        return list(totals.values())
+
+    def print_summary(self):
+        print(
+            f"{'Stage':<12} {'Calls':>6} {'Bytes':>12} {'Wall':>10} {'CPU':>10} {'Peak':>10}"
+        )
+
+        for total in self.summary():
+            peak = total.get("peak_bytes")
+            peak = "-" if peak is None else f"{peak / 2**20:.2f}MB"
+            print(
+                f"{total['span']:<12} {total['calls']:>6} {total['bytes']:>12}"
+                f" {total['wall_s'] * 1000:>8.2f}ms {total['cpu_s'] * 1000:>8.2f}ms {peak:>10}"
+            )
+
+
+@contextmanager
+def _no_span() -> Iterator[dict]:
+    yield {}
+
+
+def span(name: str, size: int = 0):
+    """
+    Span of the active instrument, or a no-op when nothing is being instrumented.
+    """
+    instrument = _current.get()
+
+    if instrument is None:
+        return _no_span()
+
+    return instrument.span(name, size)
+
+
+@contextmanager
+def profile(
+    output_path: str | None = None, cprofile_path: str | None = None
+) -> Iterator[Instrument]:
+    """
+    Instrument the body of the with block and print a summary of its spans.
+
+    Spans are also written as JSON lines to output_path when given. With
+    cprofile_path, the block is run under cProfile as well and its stats are
+    dumped there, to be read with pstats or snakeviz.
+    """
+    output = open(output_path, "w") if output_path else None
+    profiler = cProfile.Profile() if cprofile_path else None
+
+    try:
+        with Instrument(output=output) as instrument:
+            if profiler is not None:
+                profiler.enable()
+
+            try:
+                yield instrument
+            finally:
+                if profiler is not None:
+                    profiler.disable()
+                    profiler.dump_stats(cprofile_path)
+
+                instrument.print_summary()
+    finally:
+        if output is not None:
+            output.close()
@@ -0,0 +1,326 @@
+import base64
+import binascii
+import collections
+import json
+import multiprocessing
+import os
+import signal
+import socketserver
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from audiostegano.batch import run_job
+from audiostegano.input.cache import configure_cache
+
+# Number of recent jobs kept for the latency percentiles
+LATENCY_WINDOW = 1024
+
+
+class JobQueue:
+    """
+    Runs jobs on a pool of worker processes, with at most max_pending jobs
+    waiting or running at once. Jobs beyond that are rejected so clients can
+    back off instead of piling up requests in the server.
+    """
+
+    def __init__(
+        self,
+        workers: int | None = None,
+        max_pending: int | None = None,
+        cache_size: int | None = None,
+        cache_dir: str | None = None,
+        cache_dir_size: int | None = None,
+    ):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending or self.workers * 4
+        # Spawned workers do not inherit the listening socket of the server
+        self.pool = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=configure_cache,
+            initargs=(cache_size, cache_dir, cache_dir_size),
+        )
+        self.lock = threading.Lock()
+        self.pending = 0
+        self.counts = collections.Counter()
+        self.latencies: collections.deque[float] = collections.deque(
+            maxlen=LATENCY_WINDOW
+        )
+
+    def run(self, job: dict) -> dict | None:
+        """
+        Run a job and wait for its result, or return None right away when the
+        queue is full.
+        """
+        with self.lock:
+            if self.pending >= self.max_pending:
+                self.counts["rejected"] += 1
+                return None
+
+            self.pending += 1
+
+        start = time.perf_counter()
+
+        try:
+            result = self.pool.submit(run_job, job).result()
+        finally:
+            with self.lock:
+                self.pending -= 1
+
+        latency = time.perf_counter() - start
+        result["latency"] = round(latency, 6)
+
+        with self.lock:
+            self.counts[result["status"]] += 1
+
+            if result["cache"] is not None:
+                self.counts[f"cache_{result['cache']}"] += 1
+
+            self.latencies.append(latency)
+
+        return result
+
+    def metrics(self) -> dict:
+        with self.lock:
+            latencies = sorted(self.latencies)
+            pending = self.pending
+            counts = dict(self.counts)
+
+        def percentile(p: float) -> float | None:
+            if not latencies:
+                return None
+            return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))], 6)
+
+        return {
+            "workers": self.workers,
+            "max_pending": self.max_pending,
+            "running": min(pending, self.workers),
+            "queue_depth": max(0, pending - self.workers),
+            "jobs": {
+                "ok": counts.get("ok", 0),
+                "error": counts.get("error", 0),
+                "rejected": counts.get("rejected", 0),
+            },
+            "cache": {
+                "hits": counts.get("cache_hit", 0),
+                "disk_hits": counts.get("cache_disk_hit", 0),
+                "misses": counts.get("cache_miss", 0),
+            },
+            "latency": {
+                "p50": percentile(0.5),
+                "p95": percentile(0.95),
+                "max": round(latencies[-1], 6) if latencies else None,
+            },
+        }
+
+    def shutdown(self):
+        self.pool.shutdown(cancel_futures=True)
+
+
+def _write_inline(request: dict, field: str, directory: str, name: str) -> str | None:
+    """
+    Write the base64 content of field to a file, returning its path.
+
+    Raises ValueError when the content is not valid base64 or name is not a
+    usable file name.
+    """
+    data = request.get(field)
+
+    if data is None:
+        return None
+
+    if not isinstance(name, str) or os.path.basename(name) in ("", ".", ".."):
+        raise ValueError(f"Invalid file name {name!r} for {field}.")
+
+    try:
+        content = base64.b64decode(data, validate=True)
+    except (binascii.Error, TypeError):
+        raise ValueError(f"{field} is not valid base64.")
+
+    path = os.path.join(directory, os.path.basename(name))
+
+    with open(path, "wb") as f:
+        f.write(content)
+
+    return path
+
+
+def _read_inline(path: str) -> str:
+    with open(path, "rb") as f:
+        return base64.b64encode(f.read()).decode("ascii")
+
+
+def handle_job(queue: JobQueue, command: str, request: dict) -> dict | None:
+    """
+    Run an encode or decode request.
+
+    Files are given by path (carrier, message, output) or inline as base64
+    (carrier_data, message_data with message_name). Without an output path, the
+    result is returned inline as well, as a list of files when decoding an archive.
+    """
+    with tempfile.TemporaryDirectory() as scratch:
+        job = {
+            "command": command,
+            "key": request.get("key"),
+            "shuffle": request.get("shuffle"),
+            "block_shuffle": request.get("block_shuffle"),
+            "depth": request.get("depth"),
+            "sample_lsb": request.get("sample_lsb"),
+            "compress": request.get("compress"),
+            "stream": request.get("stream"),
+        }
+
+        job["carrier"] = _write_inline(
+            request, "carrier_data", scratch, "carrier"
+        ) or request.get("carrier")
+
+        inline_output = request.get("output") is None
+
+        if command == "encode":
+            job["message"] = _write_inline(
+                request, "message_data", scratch, request.get("message_name", "message")
+            ) or request.get("message")
+            job["output"] = request.get("output") or os.path.join(scratch, "out.wav")
+        else:
+            output_dir = os.path.join(scratch, "out")
+            os.mkdir(output_dir)
+            job["output"] = request.get("output") or output_dir
+
+        result = queue.run(job)
+
+        if result is None or result["status"] != "ok" or not inline_output:
+            return result
+
+        if command == "encode":
+            result["output"] = None
+            result["output_data"] = _read_inline(job["output"])
+        else:
+            names = sorted(os.listdir(job["output"]))
+            files = [
+                {
+                    "filename": name,
+                    "output_data": _read_inline(os.path.join(job["output"], name)),
+                }
+                for name in names
+            ]
+            result["output"] = None
+
+            # Archives extract to several files, every one of them is returned
+            if len(files) == 1:
+                result.update(files[0])
+            else:
+                result["files"] = files
+
+        return result
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    """
+    JSON over HTTP: POST /encode and /decode run a job, GET /metrics reports
+    the queue and the latencies.
+    """
+
+    queue: JobQueue
+
+    def _send(self, status: int, body: dict):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+
+        if status == 503:
+            self.send_header("Retry-After", "1")
+
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == "/metrics":
+            self._send(200, self.queue.metrics())
+        elif self.path == "/health":
+            self._send(200, {"status": "ok"})
+        else:
+            self._send(404, {"error": f"Unknown path {self.path}"})
+
+    def do_POST(self):
+        command = self.path.strip("/")
+
+        if command not in ("encode", "decode"):
+            self._send(404, {"error": f"Unknown path {self.path}"})
+            return
+
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length) or b"{}")
+
+            if not isinstance(request, dict):
+                raise ValueError("the body must be a JSON object")
+        except ValueError as e:
+            self._send(400, {"error": f"Invalid request: {e}"})
+            return
+
+        try:
+            result = handle_job(self.queue, command, request)
+        except ValueError as e:
+            self._send(400, {"error": f"Invalid request: {e}"})
+            return
+
+        if result is None:
+            self._send(503, {"error": "Too many pending jobs."})
+        else:
+            self._send(200 if result["status"] == "ok" else 422, result)
+
+    def address_string(self) -> str:
+        # Unix socket clients have no address
+        return self.client_address[0] if self.client_address else "unix"
+
+
+class UnixHTTPServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+
+def serve(
+    host: str = "127.0.0.1",
+    port: int = 8765,
+    socket_path: str | None = None,
+    workers: int | None = None,
+    max_pending: int | None = None,
+    cache_size: int | None = None,
+    cache_dir: str | None = None,
+    cache_dir_size: int | None = None,
+):
+    """
+    Serve encode/decode jobs until interrupted, on a Unix socket when
+    socket_path is given and on host:port otherwise.
+    """
+    queue = JobQueue(workers, max_pending, cache_size, cache_dir, cache_dir_size)
+    handler = type("Handler", (RequestHandler,), {"queue": queue})
+
+    if socket_path is not None:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+
+        server = UnixHTTPServer(socket_path, handler)
+        print(f"Listening on {socket_path} with {queue.workers} workers")
+    else:
+        server = ThreadingHTTPServer((host, port), handler)
+        print(f"Listening on http://{host}:{port} with {queue.workers} workers")
+
+    def interrupt(signum, frame):
+        raise KeyboardInterrupt
+
+    # Stop the workers as well when terminated by a service manager
+    signal.signal(signal.SIGTERM, interrupt)
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        queue.shutdown()
+
+        if socket_path is not None and os.path.exists(socket_path):
+            os.remove(socket_path)
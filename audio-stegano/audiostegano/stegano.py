@@ -1,10 +1,55 @@
+import json
 import os
 import struct
-from audiostegano.config import ENCRYPTED, RANDOM_SHUFFLE
-from audiostegano.input.input import load_audio_file, save_from_bytes
-from audiostegano.algorithm.lsb import encode, decode
-from audiostegano.algorithm.vigenere import encrypt, decrypt
-from audiostegano.algorithm.psnr import calculate_psnr
+from contextlib import contextmanager
+from itertools import chain
+from typing import BinaryIO, Callable, Iterable, Iterator, NamedTuple
+import numpy as np
+from audiostegano.config import (
+    ENCRYPTED,
+    RANDOM_SHUFFLE,
+    PCG_SHUFFLE,
+    SAMPLE_LSB,
+    CODEC_SHIFT,
+    CODEC_MASK,
+    ARCHIVE,
+    CHECKSUM,
+    BLOCK_SHUFFLE,
+)
+from audiostegano.input.input import (
+    BLOCK_SIZE,
+    load_audio_file,
+    map_audio_stream,
+    open_audio_stream,
+    probe_audio_info,
+    read_blocks,
+    save_wav,
+)
+from audiostegano.input.wav import WavInfo
+from audiostegano.algorithm.lsb import (
+    MAX_DEPTH,
+    encode,
+    encode_stream,
+    iter_decode_stream,
+    iter_decode_file,
+    read_header,
+    PayloadReader,
+    capacity,
+    set_depth,
+    get_depth,
+    get_stride,
+    make_layout,
+)
+from audiostegano.algorithm.checksum import framed_size
+from audiostegano.algorithm.vigenere import VigenereCipher, encrypt
+from audiostegano.algorithm.psnr import PsnrAccumulator, signal_power, estimate_psnr
+from audiostegano.instrument import span
+from audiostegano.archive import ArchiveEntry, pack_archive, read_index, iter_member
+from audiostegano.algorithm.compress import (
+    CODEC_NAMES,
+    compress as compress_payload,
+    iter_decompress,
+)
 
 
 def key_to_seed(key: str) -> int:
@@ -16,79 +61,503 @@ def key_to_seed(key: str) -> int:
     return seed
 
 
+def key_to_mac_key(key: str) -> bytes:
+    """
+    Key of the header tag. Unlike the seed, it depends on every character of
+    the key and their order.
+    """
+    return key.encode("utf-8")
+
+
+# Filename length stored in front of the filename and the message
+FILENAME_LENGTH_BYTES = 4
+
+
+class Capacity(NamedTuple):
+    depth: int
+    sample_lsb: bool
+    payload: int  # embeddable bytes, filename metadata included
+    message: int  # message bytes left once the filename metadata is stored
+
+
+def get_capacity(
+    input_path: str, message_name: str = ""
+) -> tuple[WavInfo, list[Capacity]]:
+    """
+    Capacity of a carrier for every depth and embedding mode, from its headers only.
+
+    message_name is the file name embedded along the message. Shuffling and
+    encryption keep the payload size, so they do not change the capacity, while
+    the gain of compression depends on the message and is not accounted for.
+    For non-WAV carriers the capacity is estimated from the container metadata.
+    """
+    info = probe_audio_info(input_path)
+    overhead = FILENAME_LENGTH_BYTES + len(message_name.encode("ascii"))
+    capacities = []
+
+    for sample_lsb in (False, True):
+        stride = get_stride(SAMPLE_LSB if sample_lsb else 0, info.sample_width)
+
+        for d in range(1, MAX_DEPTH + 1):
+            payload = capacity(info.data_size, d, stride, checksum=True)
+            capacities.append(
+                Capacity(d, sample_lsb, payload, max(0, payload - overhead))
+            )
+
+    return info, capacities
+
+
+def report_capacity(
+    info: WavInfo, payload_size: int, config: int, power: float | None = None
+):
+    """
+    Print the capacity and the expected PSNR of every LSB depth for a payload,
+    using the embedding mode of config.
+
+    The expected PSNR is only shown when the signal power of the audio is known.
+    """
+    stride = get_stride(config, info.sample_width)
+    embedded = payload_size
+
+    if config & CHECKSUM:
+        embedded = framed_size(payload_size)
+
+    print(f"Depth  Capacity (bytes)  Expected PSNR")
+
+    for d in range(1, MAX_DEPTH + 1):
+        cap = capacity(info.data_size, d, stride, bool(config & CHECKSUM))
+
+        if payload_size > cap:
+            expected = "too large"
+        elif power is None:
+            expected = "-"
+        else:
+            layout = make_layout(set_depth(config, d), embedded * 8, info.sample_width)
+            psnr = estimate_psnr(
+                power, info, layout.slots, d, stride > 1, layout.header
+            )
+            expected = f"{psnr:.2f}dB"
+
+        marker = "  <" if d == get_depth(config) else ""
+        print(f"{d:>5}  {cap:>16}  {expected:>13}{marker}")
+
+
+def perform_capacity(
+    input_path: str, message_path: str | None = None, as_json: bool = False
+):
+    message_name = ""
+    message_size = None
+
+    if message_path is not None:
+        message_name = os.path.basename(message_path)
+        message_size = os.path.getsize(message_path)
+
+    info, capacities = get_capacity(input_path, message_name)
+
+    if as_json:
+        print(
+            json.dumps(
+                {
+                    "channels": info.channels,
+                    "sample_rate": info.sample_rate,
+                    "sample_width": info.sample_width,
+                    "data_size": info.data_size,
+                    "message_size": message_size,
+                    "capacities": [c._asdict() for c in capacities],
+                }
+            )
+        )
+        return
+
+    print(
+        f"{info.channels} channels, {info.sample_rate}Hz, "
+        f"{info.sample_width * 8}-bit, {info.data_size} bytes of audio data"
+    )
+
+    if message_size is not None:
+        print(f"Message payload {message_size} bytes")
+
+    print(f"Mode        Depth  Payload (bytes)  Message (bytes)")
+
+    for c in capacities:
+        mode = "sample-lsb" if c.sample_lsb else "bytes"
+        marker = ""
+
+        if message_size is not None:
+            marker = "  fits" if message_size <= c.message else "  too large"
+
+        print(f"{mode:<10}  {c.depth:>5}  {c.payload:>15}  {c.message:>15}{marker}")
+
+    print("Shuffling and encryption do not change the capacity.")
+
+
 def perform_encode(
     input_path: str,
     message_path: str,
     output_path: str,
     shuffle: bool,
     key: str | None = None,
+    stream: bool = False,
+    block_size: int = BLOCK_SIZE,
+    depth: int = 1,
+    sample_lsb: bool = False,
+    compress: bool = False,
+    block_shuffle: bool = False,
+    workers: int = 1,
 ):
-    message_handle = open(message_path, "rb")
-    message_bytes = message_handle.read()
-    message_handle.close()
+    with span("load") as record:
+        message_handle = open(message_path, "rb")
+        message_bytes = message_handle.read()
+        message_handle.close()
+        record["bytes"] = len(message_bytes)
 
-    header, input_raw = load_audio_file(input_path)
     filename = os.path.basename(message_path)
     filename_bytes = bytes(filename, encoding="ascii")
 
     # embed filename metadata
     filename_length_bytes = struct.pack(">I", len(filename))
 
+    config = _make_config(shuffle, key, depth, sample_lsb, block_shuffle)
+
+    print(f"Message payload {len(message_bytes)} bytes")
+
+    total_message = filename_length_bytes + filename_bytes + message_bytes
+
+    if compress:
+        with span("compress", len(total_message)):
+            codec, total_message = compress_payload(total_message)
+
+        config = config | (codec << CODEC_SHIFT)
+        print(
+            f"Compressed payload to {len(total_message)} bytes with {CODEC_NAMES[codec]}"
+        )
+
+    _embed_payload(
+        input_path,
+        output_path,
+        total_message,
+        config,
+        key,
+        stream,
+        block_size,
+        workers,
+    )
+
+
+def perform_archive(
+    input_path: str,
+    message_paths: list[str],
+    output_path: str,
+    shuffle: bool,
+    key: str | None = None,
+    stream: bool = False,
+    block_size: int = BLOCK_SIZE,
+    depth: int = 1,
+    sample_lsb: bool = False,
+    compress: bool = False,
+    block_shuffle: bool = False,
+    workers: int = 1,
+):
+    with span("load") as record:
+        total_message = pack_archive(message_paths, compress)
+        record["bytes"] = len(total_message)
+
+    print(f"Archive payload {len(total_message)} bytes, {len(message_paths)} files")
+
+    # Members are compressed on their own, the archive as a whole is not
+    config = _make_config(shuffle, key, depth, sample_lsb, block_shuffle) | ARCHIVE
+
+    _embed_payload(
+        input_path,
+        output_path,
+        total_message,
+        config,
+        key,
+        stream,
+        block_size,
+        workers,
+    )
+
+
+def _make_config(
+    shuffle: bool,
+    key: str | None,
+    depth: int,
+    sample_lsb: bool,
+    block_shuffle: bool = False,
+) -> int:
     config = 0
 
     if key is not None:
         config = config | ENCRYPTED
 
-    if shuffle:
-        config = config | RANDOM_SHUFFLE
+    if block_shuffle:
+        config = config | BLOCK_SHUFFLE
+    elif shuffle:
+        config = config | RANDOM_SHUFFLE | PCG_SHUFFLE
 
-    print(f"Message payload {len(message_bytes)} bytes")
+    if sample_lsb:
+        config = config | SAMPLE_LSB
+
+    config = config | CHECKSUM
+
+    return set_depth(config, depth)
 
-    total_message = filename_length_bytes + filename_bytes + message_bytes
 
+def _embed_payload(
+    input_path: str,
+    output_path: str,
+    total_message: bytes,
+    config: int,
+    key: str | None,
+    stream: bool,
+    block_size: int,
+    workers: int = 1,
+):
     if key is not None:
-        total_message = bytes(encrypt(bytearray(total_message), key))
+        with span("encrypt", len(total_message)):
+            total_message = bytes(encrypt(bytearray(total_message), key))
 
     seed = None
+    mac_key = None
 
     if key is not None:
         seed = key_to_seed(key)
+        mac_key = key_to_mac_key(key)
+
+    if stream:
+        with open_audio_stream(input_path) as (header, info, reader):
+            report_capacity(info, len(total_message), config)
+
+            psnr = PsnrAccumulator(info)
+            blocks = encode_stream(
+                read_blocks(reader, info, block_size),
+                info.data_size,
+                config,
+                total_message,
+                seed,
+                _measured(psnr),
+                info.sample_width,
+                mac_key,
+                workers,
+            )
+
+            with open(output_path, "wb") as writer:
+                writer.write(header)
+
+                for block in blocks:
+                    with span("save", len(block)):
+                        writer.write(block)
+
+        print(f"PSNR value: {psnr.value():2f}dB")
+        return
+
+    with span("load") as record:
+        header, input_raw, info = load_audio_file(input_path)
+        record["bytes"] = info.data_size
+
+    with span("psnr", info.data_size):
+        power = signal_power(input_raw, info)
+
+    report_capacity(info, len(total_message), config, power)
+
+    psnr = PsnrAccumulator(info)
+    encoded = encode(
+        input_raw,
+        config,
+        total_message,
+        seed,
+        _measured(psnr),
+        info.sample_width,
+        mac_key,
+        workers,
+    )
+
+    with span("save", len(encoded)):
+        save_wav(header, encoded, output_path)
+    print(f"PSNR value: {psnr.value():2f}dB")
 
-    encoded = encode(input_raw, config, total_message, seed)
 
-    save_from_bytes(header + encoded, output_path)
-    psnr = calculate_psnr(header + input_raw, header + encoded)
-    print(f"PSNR value: {psnr:2f}dB")
+def _measured(psnr: PsnrAccumulator):
+    def update(original, modified=None):
+        with span("psnr", len(original)):
+            psnr.update(original, modified)
+
+    return update
 
 
 def perform_decode(
     input_path: str,
     output_path: str | None,
     key: str | None = None,
+    stream: bool = False,
+    block_size: int = BLOCK_SIZE,
+    member: str | None = None,
+    workers: int = 1,
 ):
-    header, input_raw = load_audio_file(input_path)
+    # The carrier is opened once, its header tells whether it holds an archive
+    with open_audio_stream(input_path) as (header, info, reader):
+        config = read_header(
+            reader, info.data_offset, info.data_size, sample_width=info.sample_width
+        )[1]
+
+        if config & ARCHIVE:
+            entries, read_member = _read_archive(
+                map_audio_stream(reader, info), info, key
+            )
+            _extract_members(entries, read_member, output_path, member)
+            return
+
+        if member is not None:
+            raise ValueError("The file does not hold an archive.")
+
+        reader.seek(info.data_offset)
+        filename, chunks = _decode_payload(
+            info, reader, key, stream, block_size, workers
+        )
+
+        with span("save") as record:
+            final_output, size = save_payload(filename, chunks, output_path)
+            record["bytes"] = size
+
+    print(f"Extracted message payload {size} bytes")
+
+
+@contextmanager
+def open_payload(
+    input_path: str,
+    key: str | None = None,
+    stream: bool = False,
+    block_size: int = BLOCK_SIZE,
+    workers: int = 1,
+) -> Iterator[tuple[str, Iterator[bytes]]]:
+    """
+    Decode the message embedded in an audio file lazily.
+
+    Yields the embedded filename and an iterator over the message, which is
+    extracted, decrypted and decompressed chunk by chunk as it is consumed,
+    while the with block is open. Peak memory then depends on block_size and
+    not on the message size, unless the message was shuffled globally. Block
+    shuffled messages are unshuffled on workers processes.
+    """
+    with open_audio_stream(input_path) as (header, info, reader):
+        yield _decode_payload(info, reader, key, stream, block_size, workers)
+
 
+def _decode_payload(
+    info: WavInfo,
+    reader: BinaryIO,
+    key: str | None,
+    stream: bool,
+    block_size: int,
+    workers: int,
+) -> tuple[str, Iterator[bytes]]:
+    """
+    Decode the message of an audio stream positioned at the start of its PCM
+    data, see open_payload.
+    """
     seed = None
+    mac_key = None
 
     if key is not None:
         seed = key_to_seed(key)
+        mac_key = key_to_mac_key(key)
 
-    decoded, config = decode(input_raw, seed)
+    if stream:
+        config, chunks = iter_decode_stream(
+            read_blocks(reader, info, block_size),
+            info.data_size,
+            seed,
+            info.sample_width,
+            block_size,
+            mac_key,
+            workers,
+        )
+    else:
+        config, chunks = iter_decode_file(
+            reader,
+            info.data_offset,
+            info.data_size,
+            seed,
+            info.sample_width,
+            block_size,
+            mac_key,
+            workers,
+        )
 
     if config & ENCRYPTED:
         if key is None:
             raise Exception("File is encrypted. No key is provided.")
-        else:
-            decoded = bytes(decrypt(bytearray(decoded), key))
 
-    decoded_arr = bytearray(decoded)
+        chunks = _decrypted(chunks, key)
+
+    codec = (config & CODEC_MASK) >> CODEC_SHIFT
+    chunks = iter_decompress(chunks, codec)
+
+    return split_filename(chunks)
+
+
+def _decrypted(chunks: Iterable[bytes], key: str) -> Iterator[bytes]:
+    cipher = VigenereCipher(key)
 
-    filename_length = struct.unpack(">I", decoded_arr[:4])[0]
-    filename = decoded_arr[4 : filename_length + 4].decode("ascii")
-    payload = decoded_arr[filename_length + 4 :]
+    for chunk in chunks:
+        with span("decrypt", len(chunk)):
+            plain = cipher.decrypt(chunk)
 
-    print(f"Extracted message payload {len(payload)} bytes")
+        yield plain
 
+
+def split_filename(chunks: Iterable[bytes]) -> tuple[str, Iterator[bytes]]:
+    """
+    Read the filename in front of a decoded payload (filename length, filename,
+    then the message), returning it and an iterator over the rest of the message.
+    """
+    chunks = iter(chunks)
+    head = bytearray()
+    filename_length = None
+
+    for chunk in chunks:
+        head += chunk
+
+        if filename_length is None and len(head) >= 4:
+            filename_length = struct.unpack(">I", head[:4])[0]
+
+        if filename_length is not None and len(head) >= filename_length + 4:
+            break
+
+    if filename_length is None or len(head) < filename_length + 4:
+        raise ValueError("The decoded message is truncated.")
+
+    filename = head[4 : filename_length + 4].decode("ascii")
+
+    return filename, chain([bytes(head[filename_length + 4 :])], chunks)
+
+
+def write_payload(chunks: Iterable[bytes], out: BinaryIO) -> int:
+    """
+    Write message chunks to a binary stream, returning the number of bytes written.
+    """
+    size = 0
+
+    for chunk in chunks:
+        size += out.write(chunk)
+
+    return size
+
+
+def save_payload(
+    filename: str, chunks: Iterable[bytes], output_path: str | None
+) -> tuple[str, int]:
+    """
+    Write a decoded message to a file, chunk by chunk as it comes. When
+    output_path is a directory or None, the embedded filename is used.
+
+    The chunks are written to a temporary file next to the output, which only
+    replaces it once the last chunk was decoded and verified, so a failed
+    decode leaves no partial file behind.
+
+    Returns the path of the written file and the size of the message.
+    """
     final_output: str = ""
 
     if output_path is not None:
@@ -102,5 +571,114 @@ def perform_decode(
 
     print(f"Saving to {final_output}")
 
-    with open(final_output, "wb") as w:
-        w.write(bytes(payload))
+    partial = f"{final_output}.{os.getpid()}.part"
+
+    try:
+        with open(partial, "wb") as w:
+            size = write_payload(chunks, w)
+
+        os.replace(partial, final_output)
+    except BaseException:
+        if os.path.exists(partial):
+            os.remove(partial)
+        raise
+
+    return final_output, size
+
+
+@contextmanager
+def open_archive(
+    input_path: str, key: str | None = None
+) -> Iterator[tuple[list[ArchiveEntry], Callable[[ArchiveEntry], Iterator[bytes]]]]:
+    """
+    Open the archive embedded in an audio file for random access.
+
+    Yields the archive members and a function iterating over the content of a
+    member. Only the index and the members asked for are read from the audio.
+    """
+    with open_audio_stream(input_path) as (header, info, reader):
+        yield _read_archive(map_audio_stream(reader, info), info, key)
+
+
+def _read_archive(
+    input_raw: np.ndarray, info: WavInfo, key: str | None
+) -> tuple[list[ArchiveEntry], Callable[[ArchiveEntry], Iterator[bytes]]]:
+    """
+    Read the index of the archive embedded in PCM data, see open_archive.
+    """
+    seed = None
+    mac_key = None
+
+    if key is not None:
+        seed = key_to_seed(key)
+        mac_key = key_to_mac_key(key)
+
+    reader = PayloadReader(input_raw, seed, info.sample_width, mac_key)
+
+    if not reader.config & ARCHIVE:
+        raise ValueError("The file does not hold an archive.")
+
+    if reader.config & ENCRYPTED and key is None:
+        raise Exception("File is encrypted. No key is provided.")
+
+    def read_at(offset: int, length: int) -> bytes:
+        data = reader.read(offset, length)
+
+        if reader.config & ENCRYPTED:
+            with span("decrypt", length):
+                data = VigenereCipher(key, offset).decrypt(data)
+
+        return data
+
+    entries, data_start = read_index(read_at)
+
+    def read_member(entry: ArchiveEntry) -> Iterator[bytes]:
+        return iter_member(read_at, entry, data_start)
+
+    return entries, read_member
+
+
+def perform_list(input_path: str, key: str | None = None):
+    with open_archive(input_path, key) as (entries, read_member):
+        print(f"{'Size':>12}  {'Stored':>12}  {'Codec':<5}  Name")
+
+        for entry in entries:
+            print(
+                f"{entry.size:>12}  {entry.length:>12}"
+                f"  {CODEC_NAMES[entry.codec]:<5}  {entry.name}"
+            )
+
+    print(f"{len(entries)} files")
+
+
+def perform_extract(
+    input_path: str,
+    output_path: str | None,
+    key: str | None = None,
+    member: str | None = None,
+):
+    """
+    Extract every member of an embedded archive into the output_path directory,
+    or only the member named member, which may also be saved to output_path.
+    """
+    with open_archive(input_path, key) as (entries, read_member):
+        _extract_members(entries, read_member, output_path, member)
+
+
+def _extract_members(
+    entries: list[ArchiveEntry],
+    read_member: Callable[[ArchiveEntry], Iterator[bytes]],
+    output_path: str | None,
+    member: str | None,
+):
+    if member is not None:
+        entries = [entry for entry in entries if entry.name == member]
+
+        if not entries:
+            raise ValueError(f"No member named {member} in the archive.")
+
+    for entry in entries:
+        with span("save", entry.size):
+            save_payload(entry.name, read_member(entry), output_path)
+
+    print(f"Extracted {len(entries)} files")
@@ -0,0 +1,79 @@
+import os
+import wave
+from typing import NamedTuple
+import numpy as np
+
+
+class CarrierSpec(NamedTuple):
+    seconds: float
+    sample_width: int  # bytes per sample
+    channels: int
+    sample_rate: int = 44100
+
+    @property
+    def name(self) -> str:
+        return f"{self.seconds:g}s-{self.sample_width * 8}bit-{self.channels}ch"
+
+    @property
+    def data_size(self) -> int:
+        return int(self.seconds * self.sample_rate) * self.channels * self.sample_width
+
+
+def make_carrier(spec: CarrierSpec, directory: str, seed: int = 0) -> str:
+    """
+    Write a PCM WAV file of noisy tones matching spec, returning its path.
+
+    The samples are generated in chunks so long carriers do not need to fit in memory.
+    """
+    path = os.path.join(directory, f"{spec.name}.wav")
+
+    if os.path.isfile(path):
+        return path
+
+    rng = np.random.default_rng(seed)
+    frames = int(spec.seconds * spec.sample_rate)
+    peak = 2 ** (spec.sample_width * 8 - 1) - 1
+    chunk = 1 << 18
+
+    with wave.open(path, "wb") as w:
+        w.setnchannels(spec.channels)
+        w.setsampwidth(spec.sample_width)
+        w.setframerate(spec.sample_rate)
+
+        for start in range(0, frames, chunk):
+            t = np.arange(start, min(start + chunk, frames)) / spec.sample_rate
+            tone = 0.4 * np.sin(2 * np.pi * 440 * t)[:, None]
+            noise = 0.05 * rng.standard_normal((len(t), spec.channels))
+            samples = np.round((tone + noise).clip(-1, 1) * peak).astype(np.int64)
+
+            if spec.sample_width == 1:
+                # 8-bit WAV samples are unsigned
+                samples += 128
+
+            # Little-endian bytes of every sample, truncated to the sample width
+            raw = samples.astype("<i8").view(np.uint8).reshape(-1, 8)
+            w.writeframes(raw[:, : spec.sample_width].tobytes())
+
+    return path
+
+
+def make_payload(size: int, directory: str, seed: int = 0) -> str:
+    """
+    Write a message file of size bytes, half text and half random bytes so
+    compression has something to do without being trivial.
+    """
+    path = os.path.join(directory, f"payload-{size}.bin")
+
+    if os.path.isfile(path):
+        return path
+
+    rng = np.random.default_rng(seed)
+    text = b"Lorem ipsum dolor sit amet, consectetur adipiscing elit. "
+    half = size // 2
+    body = (text * (half // len(text) + 1))[:half]
+    body += rng.integers(0, 256, size - half, dtype=np.uint8).tobytes()
+
+    with open(path, "wb") as f:
+        f.write(body)
+
+    return path
@@ -0,0 +1,342 @@
+"""
+Benchmarks of the audiostegano pipeline, stage by stage and end to end.
+
+Run from the audio-stegano directory:
+
+    python -m benchmarks.run --output before.json
+    python -m benchmarks.run --output after.json
+    python -m benchmarks.run --compare before.json after.json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from typing import Callable
+import numpy as np
+from audiostegano.config import ENCRYPTED, RANDOM_SHUFFLE, PCG_SHUFFLE
+from audiostegano.input.input import load_audio_file
+from audiostegano.algorithm.lsb import capacity, to_bits, encode, decode
+from audiostegano.algorithm.shuffle import shuffle
+from audiostegano.algorithm.vigenere import encrypt
+from audiostegano.algorithm.compress import compress
+from audiostegano.algorithm.psnr import calculate_pcm_psnr
+from audiostegano.stegano import key_to_seed, perform_encode, perform_decode
+from benchmarks.carriers import CarrierSpec, make_carrier, make_payload
+
+# The harness also runs on trees from before the header and block checksums,
+# where encode and decode take no mac_key and capacity no checksum argument
+try:
+    from audiostegano.config import CHECKSUM
+    from audiostegano.stegano import key_to_mac_key
+except ImportError:
+    CHECKSUM = 0
+    key_to_mac_key = None
+
+KEY = "benchmark"
+
+# Same config as the perform_encode stage, with a key and shuffling
+CONFIG = ENCRYPTED | RANDOM_SHUFFLE | PCG_SHUFFLE | CHECKSUM
+
+STAGES = (
+    "load_audio_file",
+    "to_bits",
+    "shuffle",
+    "vigenere",
+    "compress",
+    "lsb_encode",
+    "lsb_decode",
+    "psnr",
+    "perform_encode",
+    "perform_decode",
+)
+
+
+def _drop_cache(path: str):
+    """
+    Ask the kernel to evict a file from the page cache, so the next read is cold.
+    """
+    if not hasattr(os, "posix_fadvise"):
+        return
+
+    with open(path, "rb") as f:
+        os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_DONTNEED)
+
+
+def _measure(
+    run: Callable[[], object], repeat: int, files: tuple[str, ...] = ()
+) -> dict:
+    """
+    Time the first (cold) call of run, then repeat more warm calls, and
+    measure the peak of memory allocated by one extra call.
+    """
+    for path in files:
+        _drop_cache(path)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        run()
+        cold = time.perf_counter() - start
+
+        warm = []
+
+        for _ in range(repeat):
+            start = time.perf_counter()
+            run()
+            warm.append(time.perf_counter() - start)
+
+        # Tracing slows allocations down, so it gets a run of its own
+        tracemalloc.start()
+        run()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    return {
+        "cold_s": cold,
+        "warm_s": statistics.median(warm) if warm else cold,
+        "warm_min_s": min(warm) if warm else cold,
+        "peak_bytes": peak,
+    }
+
+
+def bench_case(
+    spec: CarrierSpec,
+    payload_size: int,
+    workdir: str,
+    repeat: int,
+    stages: tuple[str, ...],
+) -> list[dict]:
+    carrier = make_carrier(spec, workdir)
+    message_path = make_payload(payload_size, workdir)
+
+    with open(message_path, "rb") as f:
+        message = f.read()
+
+    seed = key_to_seed(KEY)
+    keys = {"mac_key": key_to_mac_key(KEY)} if CHECKSUM else {}
+
+    _, raw, info = load_audio_file(carrier)
+    bits = to_bits(message)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        encoded = np.frombuffer(
+            encode(raw, CONFIG, message, seed, sample_width=info.sample_width, **keys),
+            dtype=np.uint8,
+        )
+
+    stego_path = os.path.join(workdir, f"{spec.name}-{payload_size}.stego.wav")
+    out_dir = os.path.join(workdir, "out")
+    os.makedirs(out_dir, exist_ok=True)
+
+    runs: dict[str, tuple[Callable[[], object], tuple[str, ...]]] = {
+        "load_audio_file": (lambda: load_audio_file(carrier), (carrier,)),
+        "to_bits": (lambda: to_bits(message), ()),
+        "shuffle": (lambda: shuffle(bits, seed), ()),
+        "vigenere": (lambda: encrypt(bytearray(message), KEY), ()),
+        "compress": (lambda: compress(message), ()),
+        "lsb_encode": (
+            lambda: encode(
+                raw, CONFIG, message, seed, sample_width=info.sample_width, **keys
+            ),
+            (),
+        ),
+        "lsb_decode": (
+            lambda: decode(encoded, seed, info.sample_width, **keys),
+            (),
+        ),
+        "psnr": (lambda: calculate_pcm_psnr(raw, encoded, info), ()),
+        "perform_encode": (
+            lambda: perform_encode(
+                carrier, message_path, stego_path, True, KEY, depth=1
+            ),
+            (carrier,),
+        ),
+        "perform_decode": (
+            lambda: perform_decode(stego_path, out_dir, KEY),
+            (stego_path,),
+        ),
+    }
+
+    results = []
+
+    for stage in stages:
+        run, files = runs[stage]
+        measured = _measure(run, repeat, files)
+
+        results.append(
+            {
+                "case": f"{spec.name}/{payload_size}",
+                "stage": stage,
+                "seconds": spec.seconds,
+                "sample_width": spec.sample_width,
+                "channels": spec.channels,
+                "payload_bytes": payload_size,
+                **measured,
+            }
+        )
+
+        print(
+            f"{spec.name:<16} {payload_size:>9} {stage:<16}"
+            f" cold {measured['cold_s'] * 1000:>9.2f}ms"
+            f" warm {measured['warm_s'] * 1000:>9.2f}ms"
+            f" peak {measured['peak_bytes'] / 2**20:>8.2f}MB"
+        )
+
+    return results
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args) -> dict:
+    stages = tuple(args.stages) if args.stages else STAGES
+    checksum = {"checksum": True} if CHECKSUM else {}
+    results = []
+
+    with tempfile.TemporaryDirectory() as scratch:
+        workdir = args.workdir or scratch
+
+        for seconds in args.durations:
+            for sample_width in args.widths:
+                for channels in args.channels:
+                    spec = CarrierSpec(seconds, sample_width, channels)
+
+                    for payload_size in args.payloads:
+                        # Room for the filename metadata, see perform_encode
+                        if payload_size + 64 > capacity(spec.data_size, **checksum):
+                            continue
+
+                        results += bench_case(
+                            spec, payload_size, workdir, args.repeat, stages
+                        )
+
+    return {
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "repeat": args.repeat,
+        # Linux reports kilobytes, macOS bytes
+        "max_rss": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        "results": results,
+    }
+
+
+def compare(before_path: str, after_path: str):
+    """
+    Print the warm time and peak memory ratio of every case found in both runs.
+    """
+    with open(before_path) as f:
+        before = json.load(f)
+    with open(after_path) as f:
+        after = json.load(f)
+
+    old = {(r["case"], r["stage"]): r for r in before["results"]}
+
+    print(f"{before.get('commit')} -> {after.get('commit')}")
+    print(
+        f"{'Case':<26} {'Stage':<16} {'Warm before':>12} {'Warm after':>12} {'Speedup':>8} {'Peak':>8}"
+    )
+
+    for r in after["results"]:
+        o = old.get((r["case"], r["stage"]))
+
+        if o is None:
+            continue
+
+        speedup = o["warm_s"] / r["warm_s"] if r["warm_s"] else float("inf")
+        peak = r["peak_bytes"] / o["peak_bytes"] if o["peak_bytes"] else float("inf")
+
+        print(
+            f"{r['case']:<26} {r['stage']:<16}"
+            f" {o['warm_s'] * 1000:>10.2f}ms {r['warm_s'] * 1000:>10.2f}ms"
+            f" {speedup:>7.2f}x {peak:>7.2f}x"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the audiostegano pipeline")
+
+    parser.add_argument(
+        "--durations",
+        type=float,
+        nargs="+",
+        default=[10, 60],
+        help="Carrier durations in seconds (default 10 60)",
+    )
+    parser.add_argument(
+        "--widths",
+        type=int,
+        nargs="+",
+        choices=range(1, 5),
+        default=[1, 2, 3],
+        help="Sample widths in bytes (default 1 2 3)",
+    )
+    parser.add_argument(
+        "--channels",
+        type=int,
+        nargs="+",
+        default=[1, 2],
+        help="Channel counts (default 1 2)",
+    )
+    parser.add_argument(
+        "--payloads",
+        type=int,
+        nargs="+",
+        default=[1 << 10, 1 << 16, 1 << 20],
+        help="Payload sizes in bytes (default 1KB 64KB 1MB)",
+    )
+    parser.add_argument(
+        "--stages",
+        nargs="+",
+        choices=STAGES,
+        help="Only run these stages (default all)",
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=3, help="Number of warm runs (default 3)"
+    )
+    parser.add_argument(
+        "--workdir", help="Keep the generated carriers in this directory (optional)"
+    )
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    parser.add_argument(
+        "--compare",
+        nargs=2,
+        metavar=("BEFORE", "AFTER"),
+        help="Compare two JSON result files instead of running",
+    )
+
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    report = run(args)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
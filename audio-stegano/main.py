@@ -1,7 +1,18 @@
 import argparse
 import os
 import traceback
-from audiostegano.stegano import perform_encode, perform_decode
+from contextlib import nullcontext
+from audiostegano.stegano import (
+    perform_encode,
+    perform_decode,
+    perform_capacity,
+    perform_archive,
+    perform_list,
+)
+from audiostegano.batch import run_batch
+from audiostegano.server import serve
+from audiostegano.input.cache import configure_cache
+from audiostegano.instrument import profile
 
 
 def validate_file_path(path, should_exist=True):
@@ -23,6 +34,59 @@ def validate_key(key):
     return key
 
 
+def add_workers_argument(parser):
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of processes handling the blocks of --block-shuffle data (optional, default 1)",
+    )
+
+
+def add_cache_arguments(parser):
+    parser.add_argument(
+        "--cache-dir",
+        help="Keep carriers decoded to WAV in this directory across runs (optional)",
+    )
+
+    parser.add_argument(
+        "--cache-size",
+        type=int,
+        default=256,
+        help="Memory budget in MB of the decoded carrier cache (optional, default 256)",
+    )
+
+    parser.add_argument(
+        "--cache-dir-size",
+        type=int,
+        default=4096,
+        help="Disk budget in MB of --cache-dir, least recently used carriers are removed first (optional, default 4096)",
+    )
+
+
+def add_profile_arguments(parser):
+    parser.add_argument(
+        "--profile",
+        nargs="?",
+        const="",
+        metavar="SPANS_FILE",
+        help="Print the time and memory of every stage, and write them as JSON lines to SPANS_FILE (optional)",
+    )
+
+    parser.add_argument(
+        "--cprofile",
+        metavar="STATS_FILE",
+        help="Run under cProfile and dump its stats to STATS_FILE (optional)",
+    )
+
+
+def profiled(args):
+    if args.profile is None and args.cprofile is None:
+        return nullcontext()
+
+    return profile(args.profile, args.cprofile)
+
+
 def main():
     parser = argparse.ArgumentParser(description="File encoding and decoding tool")
     subparsers = parser.add_subparsers(dest="command", help="Commands")
@@ -52,10 +116,46 @@ def main():
         "--shuffle", action="store_true", help="Shuffle the data (optional)"
     )
 
+    encode_parser.add_argument(
+        "--block-shuffle",
+        action="store_true",
+        help="Shuffle the data within fixed-size blocks, which can be processed in parallel (optional)",
+    )
+
     encode_parser.add_argument(
         "--key", type=validate_key, help="Encryption key (optional, max 25 characters)"
     )
 
+    encode_parser.add_argument(
+        "--depth",
+        type=int,
+        choices=range(1, 5),
+        default=1,
+        help="Number of LSBs used per audio byte (optional, 1-4, default 1)",
+    )
+
+    encode_parser.add_argument(
+        "--sample-lsb",
+        action="store_true",
+        help="Only modify the least significant byte of every audio sample (optional)",
+    )
+
+    encode_parser.add_argument(
+        "--compress",
+        action="store_true",
+        help="Compress the message with the best of zlib, lzma and bz2 (optional)",
+    )
+
+    encode_parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Process the audio in fixed-size blocks to bound memory usage (optional)",
+    )
+
+    add_workers_argument(encode_parser)
+    add_cache_arguments(encode_parser)
+    add_profile_arguments(encode_parser)
+
     # Create parser for the "decode" command
     decode_parser = subparsers.add_parser("decode", help="Decode a file")
 
@@ -76,20 +176,202 @@ def main():
         "--key", type=validate_key, help="Decryption key (optional, max 25 characters)"
     )
 
+    decode_parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Process the audio in fixed-size blocks to bound memory usage (optional)",
+    )
+
+    decode_parser.add_argument(
+        "--member",
+        help="Only extract the archive member with this name (optional)",
+    )
+
+    add_workers_argument(decode_parser)
+    add_cache_arguments(decode_parser)
+    add_profile_arguments(decode_parser)
+
+    archive_parser = subparsers.add_parser(
+        "archive", help="Encode several files with an index for random access"
+    )
+
+    archive_parser.add_argument(
+        "input_file",
+        type=lambda x: validate_file_path(x, True),
+        help="Path to the input file",
+    )
+
+    archive_parser.add_argument(
+        "output_file",
+        type=lambda x: validate_file_path(x, False),
+        help="Path to the output file",
+    )
+
+    archive_parser.add_argument(
+        "message_files",
+        type=lambda x: validate_file_path(x, True),
+        nargs="+",
+        help="Paths to the message files",
+    )
+
+    archive_parser.add_argument(
+        "--shuffle", action="store_true", help="Shuffle the data (optional)"
+    )
+
+    archive_parser.add_argument(
+        "--block-shuffle",
+        action="store_true",
+        help="Shuffle the data within fixed-size blocks, which can be processed in parallel (optional)",
+    )
+
+    archive_parser.add_argument(
+        "--key", type=validate_key, help="Encryption key (optional, max 25 characters)"
+    )
+
+    archive_parser.add_argument(
+        "--depth",
+        type=int,
+        choices=range(1, 5),
+        default=1,
+        help="Number of LSBs used per audio byte (optional, 1-4, default 1)",
+    )
+
+    archive_parser.add_argument(
+        "--sample-lsb",
+        action="store_true",
+        help="Only modify the least significant byte of every audio sample (optional)",
+    )
+
+    archive_parser.add_argument(
+        "--compress",
+        action="store_true",
+        help="Compress every file with the best of zlib, lzma and bz2 (optional)",
+    )
+
+    archive_parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Process the audio in fixed-size blocks to bound memory usage (optional)",
+    )
+
+    add_workers_argument(archive_parser)
+    add_cache_arguments(archive_parser)
+    add_profile_arguments(archive_parser)
+
+    list_parser = subparsers.add_parser(
+        "list", help="List the files of an embedded archive"
+    )
+
+    list_parser.add_argument(
+        "input_file",
+        type=lambda x: validate_file_path(x, True),
+        help="Path to the input file",
+    )
+
+    list_parser.add_argument(
+        "--key", type=validate_key, help="Decryption key (optional, max 25 characters)"
+    )
+
+    capacity_parser = subparsers.add_parser(
+        "capacity", help="Show how much data a file can hold"
+    )
+
+    capacity_parser.add_argument(
+        "input_file",
+        type=lambda x: validate_file_path(x, True),
+        help="Path to the input file",
+    )
+
+    capacity_parser.add_argument(
+        "message_file",
+        type=lambda x: validate_file_path(x, True),
+        help="Path to the message file (optional)",
+        nargs="?",
+    )
+
+    capacity_parser.add_argument(
+        "--json", action="store_true", help="Print the capacity as JSON (optional)"
+    )
+
+    batch_parser = subparsers.add_parser(
+        "batch", help="Run the jobs of a manifest in parallel"
+    )
+
+    batch_parser.add_argument(
+        "manifest_file",
+        type=lambda x: validate_file_path(x, True),
+        help="Path to the CSV or JSONL manifest",
+    )
+
+    batch_parser.add_argument(
+        "summary_file",
+        type=lambda x: validate_file_path(x, False),
+        help="Path to the JSONL summary of the jobs",
+    )
+
+    batch_parser.add_argument(
+        "--workers",
+        type=int,
+        help="Number of worker processes (optional, default CPU count)",
+    )
+
+    add_cache_arguments(batch_parser)
+
+    serve_parser = subparsers.add_parser(
+        "serve", help="Run an encode/decode server on a local socket"
+    )
+
+    serve_parser.add_argument(
+        "--host", default="127.0.0.1", help="Address to listen on (default 127.0.0.1)"
+    )
+
+    serve_parser.add_argument(
+        "--port", type=int, default=8765, help="Port to listen on (default 8765)"
+    )
+
+    serve_parser.add_argument(
+        "--socket", help="Listen on this Unix socket instead of TCP (optional)"
+    )
+
+    serve_parser.add_argument(
+        "--workers",
+        type=int,
+        help="Number of worker processes (optional, default CPU count)",
+    )
+
+    serve_parser.add_argument(
+        "--max-pending",
+        type=int,
+        help="Jobs queued or running before new ones are rejected (optional, default 4 per worker)",
+    )
+
+    add_cache_arguments(serve_parser)
+
     # Parse arguments
     args = parser.parse_args()
 
     # Process commands
     if args.command == "encode":
         try:
-            perform_encode(
-                args.input_file,
-                args.message_file,
-                args.output_file,
-                args.shuffle,
-                args.key,
+            configure_cache(
+                args.cache_size << 20, args.cache_dir, args.cache_dir_size << 20
             )
 
+            with profiled(args):
+                perform_encode(
+                    args.input_file,
+                    args.message_file,
+                    args.output_file,
+                    args.shuffle,
+                    args.key,
+                    args.stream,
+                    depth=args.depth,
+                    sample_lsb=args.sample_lsb,
+                    compress=args.compress,
+                    block_shuffle=args.block_shuffle,
+                    workers=args.workers,
+                )
+
         except Exception as e:
             # print(traceback.format_exc())
             print(f"Error: {str(e)}")
@@ -98,15 +380,88 @@ def main():
         print(f"Decoding file: {args.input_file}")
 
         try:
-            perform_decode(
-                args.input_file,
-                args.output_file,
-                args.key,
+            configure_cache(
+                args.cache_size << 20, args.cache_dir, args.cache_dir_size << 20
             )
+
+            with profiled(args):
+                perform_decode(
+                    args.input_file,
+                    args.output_file,
+                    args.key,
+                    args.stream,
+                    member=args.member,
+                    workers=args.workers,
+                )
         except Exception as e:
             # print(traceback.format_exc())
             print(f"Error: {str(e)}")
 
+    elif args.command == "archive":
+        try:
+            configure_cache(
+                args.cache_size << 20, args.cache_dir, args.cache_dir_size << 20
+            )
+
+            with profiled(args):
+                perform_archive(
+                    args.input_file,
+                    args.message_files,
+                    args.output_file,
+                    args.shuffle,
+                    args.key,
+                    args.stream,
+                    depth=args.depth,
+                    sample_lsb=args.sample_lsb,
+                    compress=args.compress,
+                    block_shuffle=args.block_shuffle,
+                    workers=args.workers,
+                )
+
+        except Exception as e:
+            # print(traceback.format_exc())
+            print(f"Error: {str(e)}")
+
+    elif args.command == "list":
+        try:
+            perform_list(args.input_file, args.key)
+        except Exception as e:
+            # print(traceback.format_exc())
+            print(f"Error: {str(e)}")
+
+    elif args.command == "capacity":
+        try:
+            perform_capacity(args.input_file, args.message_file, args.json)
+        except Exception as e:
+            # print(traceback.format_exc())
+            print(f"Error: {str(e)}")
+
+    elif args.command == "batch":
+        try:
+            run_batch(
+                args.manifest_file,
+                args.summary_file,
+                args.workers,
+                args.cache_size << 20,
+                args.cache_dir,
+                args.cache_dir_size << 20,
+            )
+        except Exception as e:
+            # print(traceback.format_exc())
+            print(f"Error: {str(e)}")
+
+    elif args.command == "serve":
+        serve(
+            args.host,
+            args.port,
+            args.socket,
+            args.workers,
+            args.max_pending,
+            args.cache_size << 20,
+            args.cache_dir,
+            args.cache_dir_size << 20,
+        )
+
 
 if __name__ == "__main__":
     main()
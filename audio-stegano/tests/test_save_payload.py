@@ -0,0 +1,72 @@
+import os
+import wave
+import numpy as np
+import pytest
+from audiostegano.input.wav import read_wav_info
+from audiostegano.stegano import perform_encode, perform_decode
+
+MESSAGE_SIZE = 300_000
+
+
+def _make_carrier(path: str):
+    samples = np.random.default_rng(1).integers(
+        -(1 << 15), 1 << 15, MESSAGE_SIZE * 9, dtype=np.int16
+    )
+
+    with wave.open(path, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(44100)
+        w.writeframes(samples.tobytes())
+
+
+@pytest.fixture
+def stego(tmp_path):
+    carrier = str(tmp_path / "carrier.wav")
+    message = str(tmp_path / "rand.bin")
+    output = str(tmp_path / "stego.wav")
+
+    _make_carrier(carrier)
+
+    with open(message, "wb") as f:
+        f.write(np.random.default_rng(2).bytes(MESSAGE_SIZE))
+
+    perform_encode(carrier, message, output, False)
+
+    return output, message
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_decode_writes_output(tmp_path, stego, stream):
+    output, message = stego
+    out_dir = tmp_path / "out"
+    out_dir.mkdir()
+
+    perform_decode(output, str(out_dir), stream=stream, block_size=1 << 16)
+
+    assert os.listdir(out_dir) == ["rand.bin"]
+
+    with open(message, "rb") as expected, open(out_dir / "rand.bin", "rb") as actual:
+        assert actual.read() == expected.read()
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_corrupted_block_leaves_no_output(tmp_path, stego, stream):
+    output, _ = stego
+    out_dir = tmp_path / "out"
+    out_dir.mkdir()
+
+    with open(output, "r+b") as f:
+        info = read_wav_info(f)
+        # One message bit per audio byte after the 96 header bytes, flip one
+        # near the end so the first blocks are already written when it fails
+        position = info.data_offset + 96 + (MESSAGE_SIZE - 1000) * 8
+        f.seek(position)
+        byte = f.read(1)[0]
+        f.seek(position)
+        f.write(bytes([byte ^ 1]))
+
+    with pytest.raises(ValueError, match="Checksum mismatch"):
+        perform_decode(output, str(out_dir), stream=stream, block_size=1 << 16)
+
+    assert os.listdir(out_dir) == []
@@ -1,3 +1,4 @@
+import os
 import vlc
 import tkinter as tk
 from tkinter import filedialog, messagebox, ttk
@@ -52,19 +53,28 @@ class SteganographyApp:
         )
         self.checkbox_encryption.grid(row=5, column=0, padx=10, pady=10)
         
+        # Jumlah proses untuk memproses frame
+        self.label_workers = tk.Label(root, text="Worker:")
+        self.label_workers.grid(row=6, column=0, padx=10, pady=10)
+        cpu_count = os.cpu_count() or 1
+        self.spinbox_workers = tk.Spinbox(root, from_=1, to=max(64, cpu_count), width=5)
+        self.spinbox_workers.grid(row=6, column=1, padx=10, pady=10, sticky="w")
+        self.spinbox_workers.delete(0, tk.END)
+        self.spinbox_workers.insert(0, cpu_count)
+        
         # Tombol Embed dan Extract
         self.button_embed = tk.Button(root, text="Embed Pesan", command=self.embed_message)
-        self.button_embed.grid(row=6, column=0, padx=10, pady=10)
+        self.button_embed.grid(row=7, column=0, padx=10, pady=10)
         self.button_extract = tk.Button(root, text="Extract Pesan", command=self.extract_message)
-        self.button_extract.grid(row=6, column=1, padx=10, pady=10)
+        self.button_extract.grid(row=7, column=1, padx=10, pady=10)
         
         # Tombol Play Video
         self.button_play = tk.Button(root, text="Play Video", command=self.play_video)
-        self.button_play.grid(row=6, column=2, padx=10, pady=10)
+        self.button_play.grid(row=7, column=2, padx=10, pady=10)
         
         # Label untuk Menampilkan PSNR
         self.label_psnr = tk.Label(root, text="PSNR: - dB")
-        self.label_psnr.grid(row=7, column=0, columnspan=3, padx=10, pady=10)
+        self.label_psnr.grid(row=8, column=0, columnspan=3, padx=10, pady=10)
         
         # Inisialisasi VLC Instance
         self.vlc_instance = vlc.Instance()
@@ -80,6 +90,19 @@ class SteganographyApp:
         self.entry_message.delete(0, tk.END)
         self.entry_message.insert(0, file_path)
     
+    def get_workers(self):
+        """Jumlah worker dari input, None jika tidak valid."""
+        try:
+            workers = int(self.spinbox_workers.get())
+        except ValueError:
+            workers = 0
+        
+        if workers < 1:
+            messagebox.showerror("Error", "Jumlah worker harus bilangan bulat positif.")
+            return None
+        
+        return workers
+    
     def embed_message(self):
         video_path = self.entry_video.get()
         message_path = self.entry_message.get()
@@ -92,10 +115,14 @@ class SteganographyApp:
             messagebox.showerror("Error", "Harap pilih video dan pesan/file.")
             return
         
+        workers = self.get_workers()
+        if workers is None:
+            return
+        
         try:
             output_video_path = filedialog.asksaveasfilename(defaultextension=".avi", filetypes=[("AVI Files", "*.avi")])
             if output_video_path:
-                result = embed_message_in_video(video_path, message_path, output_video_path, key, sequential_frames, sequential_pixels, use_encryption)
+                result = embed_message_in_video(video_path, message_path, output_video_path, key, sequential_frames, sequential_pixels, use_encryption, workers=workers)
                 
                 if isinstance(result, tuple):
                     avg_psnr = result[0]
@@ -122,8 +149,12 @@ class SteganographyApp:
             messagebox.showerror("Error", "Harap pilih video.")
             return
         
+        workers = self.get_workers()
+        if workers is None:
+            return
+        
         try:
-            message, original_filename, file_extension = extract_message_from_video(video_path, key, use_encryption)
+            message, original_filename, file_extension = extract_message_from_video(video_path, key, use_encryption, workers=workers)
             
             output_file_path = filedialog.asksaveasfilename(
                 defaultextension=file_extension,
@@ -5,35 +5,106 @@ from subprocess import call, STDOUT
 from vigenereExtended import encrypt, decrypt
 import logging
 import random 
-import re
-
-# Konfigurasi logger
-logging.basicConfig(
-    level=logging.DEBUG,  # Level logging: DEBUG, INFO, WARNING, ERROR, CRITICAL
-    format='%(asctime)s - %(levelname)s - %(message)s',  # Format pesan log
-    filename='steganography.log',  # Menyimpan log ke file
-    filemode='w'  # Mode file: 'w' untuk menulis ulang, 'a' untuk menambahkan
-)
-
-# Fungsi untuk mengekstrak frame dari video
-def extract_frames(video_path, output_folder):
-    logging.info(f"Mengekstrak frame dari video: {video_path}")
-    if not os.path.exists(output_folder):
-        os.makedirs(output_folder)
-        logging.debug(f"Membuat folder: {output_folder}")
-    
+import multiprocessing
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from functools import lru_cache
+
+# Jumlah urutan pixel acak (per seed dan ukuran frame) yang disimpan di cache,
+# satu urutan frame 1080p berukuran sekitar 8 MB
+PIXEL_ORDER_CACHE_SIZE = 4
+
+# Lompatan frame ke depan yang lebih jauh dari ini memakai seek, bukan grab()
+SEEK_THRESHOLD = 16
+
+# Konfigurasi logger, tidak dilakukan ulang oleh proses worker agar log tidak tertimpa
+if multiprocessing.parent_process() is None:
+    logging.basicConfig(
+        level=logging.DEBUG,  # Level logging: DEBUG, INFO, WARNING, ERROR, CRITICAL
+        format='%(asctime)s - %(levelname)s - %(message)s',  # Format pesan log
+        filename='steganography.log',  # Menyimpan log ke file
+        filemode='w'  # Mode file: 'w' untuk menulis ulang, 'a' untuk menambahkan
+    )
+
+# Fungsi untuk membaca frame dari video satu per satu tanpa menyimpannya ke disk
+def iter_frames(video_path):
+    """
+    Generator frame dari video.
+    - video_path: Path video yang akan dibaca.
+    - Menghasilkan setiap frame (array numpy BGR) secara berurutan.
+    """
     vidcap = cv2.VideoCapture(video_path)
-    success, image = vidcap.read()
-    count = 0
-    
-    while success:
-        frame_path = os.path.join(output_folder, f"frame{count}.png")
-        cv2.imwrite(frame_path, image)
+    try:
         success, image = vidcap.read()
-        count += 1
-    
-    logging.info(f"Total frame yang diekstrak: {count}")
-    return count
+        while success:
+            yield image
+            success, image = vidcap.read()
+    finally:
+        vidcap.release()
+
+# Fungsi untuk membaca frame tertentu saja dari video
+def read_frames(video_path, indices):
+    """
+    Generator frame pada indeks tertentu, sesuai urutan indices, tanpa membaca seluruh video.
+    Frame yang dekat di depan dilewati dengan grab(), lompatan jauh atau mundur memakai seek
+    (CAP_PROP_POS_FRAMES). Jika container tidak mendukung seek, video dibaca ulang dari awal.
+    - video_path: Path video yang akan dibaca.
+    - indices: Urutan indeks frame yang dibutuhkan.
+    - Menghasilkan (indeks, frame), frame bernilai None jika gagal dibaca.
+    """
+    vidcap = cv2.VideoCapture(video_path)
+    position = 0  # Indeks frame yang akan dibaca berikutnya
+
+    try:
+        for index in indices:
+            if index < position or index - position > SEEK_THRESHOLD:
+                if vidcap.set(cv2.CAP_PROP_POS_FRAMES, index):
+                    position = index
+                elif index < position:
+                    vidcap.release()
+                    vidcap = cv2.VideoCapture(video_path)
+                    position = 0
+
+            while position < index and vidcap.grab():
+                position += 1
+
+            success, frame = vidcap.read() if position == index else (False, None)
+            if success:
+                position += 1
+            yield index, frame if success else None
+    finally:
+        vidcap.release()
+
+# Fungsi untuk membaca satu frame dari video
+def read_frame(video_path, index):
+    [(_, frame)] = read_frames(video_path, [index])
+    return frame
+
+# Fungsi untuk membaca informasi video (jumlah frame, FPS, ukuran frame)
+def get_video_info(video_path, count_frames=False):
+    """
+    Mengambil jumlah frame, FPS, lebar, dan tinggi video dari metadata container.
+    Jumlah frame di metadata hanya perkiraan untuk banyak container. Dengan
+    count_frames, atau jika tidak tersedia di metadata, frame dihitung satu per satu.
+    """
+    vidcap = cv2.VideoCapture(video_path)
+    if not vidcap.isOpened():
+        raise RuntimeError(f"Gagal membuka video: {video_path}")
+
+    frame_count = int(vidcap.get(cv2.CAP_PROP_FRAME_COUNT))
+    fps = vidcap.get(cv2.CAP_PROP_FPS)
+    width = int(vidcap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(vidcap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+
+    if count_frames or frame_count <= 0:
+        # grab() tidak mengonversi frame, lebih murah daripada read()
+        frame_count = 0
+        while vidcap.grab():
+            frame_count += 1
+
+    vidcap.release()
+    logging.info(f"Info video {video_path}: {frame_count} frame, {fps} FPS, {width}x{height}")
+    return frame_count, fps, width, height
 
 # Fungsi untuk memeriksa apakah video memiliki audio
 def has_audio(video_path):
@@ -86,50 +157,162 @@ def extract_audio(video_path, output_audio_path):
         logging.error(f"Gagal mengekstrak audio: {e}")
         raise RuntimeError(f"Gagal mengekstrak audio dari video: {e}")
     
-# Fungsi untuk membuat video dari frame
-def create_video_from_frames(frame_folder, output_video_path, fps):
-    logging.info(f"Membuat video dari frame di folder: {frame_folder}")
-    
-    # Ambil semua frame PNG
-    frames = [img for img in os.listdir(frame_folder) if img.endswith(".png")]
-    if not frames:
-        raise FileNotFoundError("Tidak ada frame PNG di folder.")
-    
-    # Urutkan berdasarkan nomor frame
-    frames.sort(key=lambda x: int(re.search(r'\d+', x).group()))
-    
-    # Path video sementara
-    temp = output_video_path.replace(".avi", "_noaudio.avi")
-    
-    # Cek ukuran frame pertama
-    frame = cv2.imread(os.path.join(frame_folder, frames[0]))
-    if frame is None:
-        raise RuntimeError("Frame pertama tidak bisa dibaca.")
-    
+# Fungsi untuk membuat urutan pixel acak dari seed
+@lru_cache(maxsize=PIXEL_ORDER_CACHE_SIZE)
+def _seeded_pixel_order(height, width, seed):
+    pixels = list(range(height * width))
+    random.Random(seed).shuffle(pixels)  # Generator lokal, state global tidak berubah
+    order = np.array(pixels, dtype=np.int32)
+    order.setflags(write=False)  # Dipakai bersama oleh semua pemanggil
+    return order
+
+def pixel_order(height, width, seed=None):
+    """
+    Urutan pixel acak dalam bentuk array indeks pixel (int32, baris * width + kolom),
+    sama dengan mengacak daftar koordinat (i, j) menggunakan random.seed(seed).
+    - height, width: Ukuran frame.
+    - seed: Seed urutan acak. Urutan untuk seed dan ukuran yang sama diambil dari cache.
+      Jika None, random global dipakai tanpa cache seperti sebelumnya.
+    """
+    if seed is None:
+        pixels = list(range(height * width))
+        random.shuffle(pixels)
+        return np.array(pixels, dtype=np.int32)
+
+    return _seeded_pixel_order(height, width, seed)
+
+# Fungsi untuk menentukan posisi LSB yang dipakai dalam frame
+def lsb_positions(frame, bit_count, sequential_pixels=True, seed=None):
+    """
+    Menentukan indeks elemen frame (yang diratakan menjadi baris, kolom, channel)
+    untuk bit_count bit pertama.
+    - frame: Frame yang akan disisipi atau diekstrak.
+    - bit_count: Jumlah bit yang dibutuhkan.
+    - sequential_pixels: True jika pixel dipilih sekuensial, False jika acak.
+    - seed: Seed untuk random generator jika pixel acak.
+    - Mengembalikan slice (sekuensial) atau array indeks (acak).
+    """
+    if sequential_pixels:
+        return slice(0, bit_count)
+
+    # Urutan pixel acak sama dengan mengacak daftar koordinat (i, j),
+    # setiap pixel menampung 3 bit berurutan pada channel 0, 1, 2
     height, width, _ = frame.shape
-    
-    # Gunakan codec yang stabil
-    fourcc = cv2.VideoWriter_fourcc(*'FFV1')
-    video = cv2.VideoWriter(temp, fourcc, fps, (width, height))
-    
-    if not video.isOpened():
-        raise RuntimeError("Gagal membuka VideoWriter.")
-    
-    # Tulis setiap frame ke video
-    for frame_name in frames:
-        frame_path = os.path.join(frame_folder, frame_name)
-        frame = cv2.imread(frame_path)
-        if frame is None:
-            logging.warning(f"Frame {frame_path} tidak bisa dibaca, dilewati.")
-            continue
-        
-        video.write(frame)
-    
-    # Tutup VideoWriter
-    video.release()
-    logging.info(f"Video berhasil disimpan di: {temp}")
-    
-    return temp
+    pixel_count = -(-bit_count // 3)
+    pixels = pixel_order(height, width, seed)[:pixel_count].astype(np.int64)
+    return (pixels[:, None] * 3 + np.arange(3)).reshape(-1)[:bit_count]
+
+# Fungsi untuk mengganti LSB frame pada posisi tertentu
+def embed_lsb(frame, bits, positions):
+    """
+    Mengganti LSB elemen frame pada positions dengan bits (diubah langsung).
+    """
+    flat = frame.reshape(-1)
+    flat[positions] = (flat[positions] & 0xFE) | bits
+
+    # reshape hanya menyalin jika frame tidak contiguous, salin kembali hasilnya
+    if not np.shares_memory(flat, frame):
+        frame[...] = flat.reshape(frame.shape)
+
+# Fungsi untuk mengubah array bit hasil ekstraksi menjadi byte
+def pack_lsb_bits(bits):
+    """
+    Mengelompokkan bit per 8 menjadi byte. Sisa bit terakhir yang kurang dari 8
+    dijadikan satu byte dengan nilai biner sisa bit tersebut.
+    """
+    whole = len(bits) - len(bits) % 8
+    message = np.packbits(bits[:whole]).tobytes()
+
+    if whole < len(bits):
+        message += bytes([int("".join(str(bit) for bit in bits[whole:]), 2)])
+
+    return message
+
+# Fungsi untuk menyisipkan header ke dalam frame (pixel sekuensial)
+def encode_header_in_frame(frame, header):
+    """
+    Menyisipkan header ke LSB frame secara sekuensial (baris, kolom, channel).
+    - frame: Frame tempat header disisipkan (diubah langsung).
+    - header: Header dalam bentuk byte.
+    - Mengembalikan jumlah bit header.
+    """
+    header_bits = np.unpackbits(np.frombuffer(header, dtype=np.uint8))
+    header_length = len(header_bits)
+    bit_count = min(header_length, frame.size)
+    embed_lsb(frame, header_bits[:bit_count], lsb_positions(frame, bit_count))
+
+    return header_length
+
+# Fungsi untuk menghitung potongan pesan yang disisipkan pada setiap frame
+def plan_payload_frames(payload_frames, message, frame_capacity):
+    """
+    Menentukan frame mana yang membawa pesan dan mulai dari byte ke berapa,
+    sama seperti urutan penyisipan frame demi frame.
+    - payload_frames: Urutan indeks frame pembawa pesan (tanpa frame header).
+    - message: Pesan dalam bentuk byte.
+    - frame_capacity: Jumlah bit yang muat dalam satu frame.
+    - Mengembalikan dict {indeks frame: offset byte pesan} dan total bit yang disisipkan.
+    """
+    message_length = len(message) * 8
+    plan = {}
+    total_bits_embedded = 0
+
+    for i in payload_frames:
+        if total_bits_embedded >= message_length:
+            break
+
+        # Pesan dipotong per byte, sisa bit dari byte terakhir disisipkan ulang
+        offset = total_bits_embedded // 8
+        plan[i] = offset
+        total_bits_embedded += min((len(message) - offset) * 8, frame_capacity)
+
+    return plan, total_bits_embedded
+
+# Fungsi untuk menghitung frame yang perlu dibaca saat ekstraksi
+def plan_extract_frames(payload_frames, message_length, frame_capacity):
+    """
+    Menentukan frame pembawa pesan yang perlu dibaca dan jumlah byte dari setiap frame.
+    - payload_frames: Urutan indeks frame pembawa pesan (tanpa frame header).
+    - message_length: Panjang pesan dalam byte.
+    - frame_capacity: Jumlah bit yang muat dalam satu frame.
+    - Mengembalikan list (indeks frame, jumlah byte).
+    """
+    frame_bytes = -(-frame_capacity // 8)  # Sisa bit terakhir dihitung sebagai satu byte
+    plan = []
+    bytes_planned = 0
+
+    for i in payload_frames:
+        if bytes_planned >= message_length:
+            break
+
+        length = min(message_length - bytes_planned, frame_bytes)
+        plan.append((i, length))
+        bytes_planned += length
+
+    return plan
+
+# Fungsi untuk membuat process pool pemrosesan frame
+def frame_executor(workers):
+    """
+    Process pool untuk memproses frame secara paralel, None jika workers <= 1 (serial).
+    """
+    return ProcessPoolExecutor(workers) if workers > 1 else None
+
+# Fungsi untuk mengambil hasil frame yang diproses serial (nilai) atau paralel (Future)
+def frame_result(result):
+    return result.result() if isinstance(result, Future) else result
+
+# Fungsi untuk menyisipkan potongan pesan ke satu frame pembawa pesan
+def embed_carrier_frame(frame, message, frame_index, sequential_pixels=True, seed=None):
+    """
+    Menyisipkan pesan ke frame dan menghitung PSNR frame tersebut. Dapat dijalankan
+    pada proses worker karena hanya bergantung pada argumennya.
+    - Mengembalikan frame yang telah disisipi dan nilai PSNR-nya.
+    """
+    original_frame = frame.copy()
+    bits_embedded = encode_message_in_frame(frame, message, frame_index, sequential_pixels, seed=seed)
+    logging.info(f"Frame {frame_index} telah disisipi {bits_embedded} bit pesan.")
+    return frame, calculate_psnr(original_frame, frame)
 
 # Fungsi untuk menyisipkan pesan ke dalam frame menggunakan LSB
 def encode_message_in_frame(frame, message, frame_index, sequential_pixels=True, seed=None):
@@ -142,8 +325,8 @@ def encode_message_in_frame(frame, message, frame_index, sequential_pixels=True,
     - seed: Seed untuk random generator jika pixel acak.
     - Mengembalikan jumlah bit yang berhasil disisipkan.
     """
-    # Konversi pesan ke biner
-    binary_message = ''.join(format(byte, '08b') for byte in message)
+    # Konversi pesan ke array bit
+    binary_message = np.unpackbits(np.frombuffer(message, dtype=np.uint8))
     message_length = len(binary_message)
     logging.debug(f"Sisipkan pesan ke dalam frame {frame_index}. Panjang pesan: {message_length} bit.")
     
@@ -151,35 +334,13 @@ def encode_message_in_frame(frame, message, frame_index, sequential_pixels=True,
     if message_length > frame.size * 3:
         raise ValueError("Pesan terlalu besar untuk disisipkan dalam frame ini.")
     
-    # Jika pixel acak, inisialisasi random generator dengan seed
-    if not sequential_pixels:
-        if seed is not None:
-            random.seed(seed)  # Gunakan seed untuk memastikan urutan acak yang sama
-        # Buat daftar semua koordinat pixel
-        height, width, _ = frame.shape
-        pixels = [(i, j) for i in range(height) for j in range(width)]
-        random.shuffle(pixels)  # Acak urutan pixel
-    
-    index = 0  # Indeks untuk melacak bit pesan yang sudah disisipkan
-    for i in range(frame.shape[0]):
-        for j in range(frame.shape[1]):
-            # Jika pixel acak, gunakan urutan yang sudah diacak
-            if not sequential_pixels:
-                i, j = pixels[index // 3]  # Ambil pixel berikutnya dari daftar acak
-            
-            for k in range(3):  # Untuk setiap channel (R, G, B)
-                if index < message_length:
-                    original_pixel = frame[i, j, k]
-                    modified_pixel = (original_pixel & 0xFE) | int(binary_message[index])
-                    frame[i, j, k] = modified_pixel
-                    
-                    index += 1
-                else:
-                    logging.debug(f"Semua bit pesan telah disisipkan. Total bit yang disisipkan: {index}")
-                    return index  # Kembalikan jumlah bit yang berhasil disisipkan
-    
-    logging.debug(f"Semua bit pesan telah disisipkan. Total bit yang disisipkan: {index}")
-    return index  # Kembalikan jumlah bit yang berhasil disisipkan
+    # Bit yang tidak muat pada frame ini akan disisipkan pada frame berikutnya
+    bit_count = min(message_length, frame.size)
+    positions = lsb_positions(frame, bit_count, sequential_pixels, seed)
+    embed_lsb(frame, binary_message[:bit_count], positions)
+    
+    logging.debug(f"Semua bit pesan telah disisipkan. Total bit yang disisipkan: {bit_count}")
+    return bit_count  # Kembalikan jumlah bit yang berhasil disisipkan
 
 def decode_message_from_frame(frame, message_length, sequential_pixels=True, seed=None):
     """
@@ -197,39 +358,21 @@ def decode_message_from_frame(frame, message_length, sequential_pixels=True, see
     if frame is None:
         raise ValueError("Frame tidak boleh None")
 
-    height, width, _ = frame.shape
     total_bits = message_length * 8  # Konversi panjang pesan ke bit
-    binary_message = []
-    
-    # Jika pixel acak, acak urutan akses pixel dengan seed tertentu
-    if not sequential_pixels:
-        if seed is not None:
-            random.seed(seed)  # Gunakan seed yang sama seperti saat penyisipan
-        # Buat daftar semua koordinat pixel
-        pixels = [(i, j) for i in range(height) for j in range(width)]
-        random.shuffle(pixels)  # Acak urutan pixel
-    else:
-        pixels = [(i, j) for i in range(height) for j in range(width)]  # Default sequential
-
-    bit_count = 0  # Menghitung bit yang sudah diekstrak
-
-    for (i, j) in pixels:
-        for channel in range(3):  # Loop untuk setiap channel warna (R, G, B)
-            if bit_count < total_bits:
-                lsb = frame[i, j, channel] & 1  # Ekstrak bit LSB
-                binary_message.append(str(lsb))
-                bit_count += 1
-            else:
-                # Jika semua bit sudah diambil, konversi biner ke bytes
-                byte_message = bytes([int("".join(binary_message[i:i+8]), 2) for i in range(0, len(binary_message), 8)])
-                return byte_message
-
-    # Konversi seluruh bit menjadi byte (untuk memastikan pesan tetap terbaca)
-    byte_message = bytes([int("".join(binary_message[i:i+8]), 2) for i in range(0, len(binary_message), 8)])
-    return byte_message
+    bit_count = min(total_bits, frame.size)  # Tidak lebih dari kapasitas frame
+    
+    positions = lsb_positions(frame, bit_count, sequential_pixels, seed)
+    binary_message = frame.reshape(-1)[positions] & 1  # Ekstrak bit LSB
+    
+    return pack_lsb_bits(binary_message)
 
 # Fungsi utama untuk menyisipkan pesan ke dalam video
-def embed_message_in_video(video_path, file_to_embed, output_video_path, key=None, sequential_frames=True, sequential_pixels=True, useEncryption=False):
+def embed_message_in_video(video_path, file_to_embed, output_video_path, key=None, sequential_frames=True, sequential_pixels=True, useEncryption=False, workers=1):
+    """
+    Menyisipkan file ke dalam video.
+    - workers: Jumlah proses untuk menyisipkan pesan ke frame secara paralel.
+      Hasilnya sama dengan mode serial (workers=1).
+    """
     logging.info("Memulai proses penyisipan pesan ke dalam video")
     
     # Baca file yang akan disisipkan
@@ -270,101 +413,99 @@ def embed_message_in_video(video_path, file_to_embed, output_video_path, key=Non
         message = encrypt(message, key)
         header = encrypt(header, key)
     
-    frame_folder = "tmp_frames"
     audio_path = "tmp/audio.mp3"
 
-
-    # Ekstrak frame dan audio dari video
-    frame_count = extract_frames(video_path, frame_folder)
+    # Baca informasi video dan ekstrak audio, frame dibaca langsung dari video
+    # Urutan frame acak bergantung pada jumlah frame, sehingga jumlahnya harus tepat
+    frame_count, fps, width, height = get_video_info(video_path, count_frames=not sequential_frames)
     extract_audio(video_path, audio_path)
     logging.info(f"Total frame dalam video: {frame_count}")
+    logging.info(f"FPS video: {fps}")
+
+    if frame_count == 0:
+        raise RuntimeError(f"Video {video_path} tidak memiliki frame.")
 
-    # Sisipkan pesan ke dalam frame
-    message_length = len(message) * 8  # Panjang pesan dalam bit
-    
     # Inisialisasi random generator dengan seed dari key jika ada
-    if key:
-        random.seed(sum(ord(char) for char in key))  # Gunakan key sebagai seed
+    rng = random.Random(sum(ord(char) for char in key)) if key else random
     
     # Pilih frame yang akan disisipi pesan
     if sequential_frames:
         selected_frames = range(frame_count)  # Semua frame sekuensial
     else:
-        selected_frames = random.sample(range(frame_count), frame_count)  # Frame acak
+        selected_frames = rng.sample(range(frame_count), frame_count)  # Frame acak
     
     logging.info(f"Frame yang akan disisipi pesan: {selected_frames}")
-    total_bits_embedded = 0  # Jumlah total bit yang telah disisipkan
 
-    # Sisipkan header pada frame pertama yang dipilih
-    header_frame_index = selected_frames[0]  # Frame pertama dalam urutan yang dipilih
-    header_frame_path = os.path.join(frame_folder, f"frame{header_frame_index}.png")
-    header_frame = cv2.imread(header_frame_path)
+    # Header pada frame pertama yang dipilih, pesan utama pada frame selanjutnya
+    header_frame_index = selected_frames[0]
+    frame_capacity = width * height * 3  # 1 bit per channel
+    plan, total_bits_embedded = plan_payload_frames(selected_frames[1:], message, frame_capacity)
+    logging.info(f"Frame pembawa pesan: {list(plan)}. Total bit yang akan disisipkan: {total_bits_embedded}")
 
-    if header_frame is None:
-        logging.error(f"Frame {header_frame_index} gagal dimuat dari {header_frame_path}.")
-        raise RuntimeError(f"Frame {header_frame_index} gagal dimuat dari {header_frame_path}.")
+    # Batas encode_message_in_frame untuk sisa pesan pada frame pembawa pertama,
+    # diperiksa di sini karena setiap frame hanya menerima potongannya sendiri
+    if plan and len(message) * 8 > frame_capacity * 3:
+        raise ValueError("Pesan terlalu besar untuk disisipkan dalam frame ini.")
+    frame_bytes = -(-frame_capacity // 8)
+
+    # Frame langsung ditulis ke encoder tanpa file gambar sementara
+    temp = output_video_path.replace(".avi", "_noaudio.avi")
+    fourcc = cv2.VideoWriter_fourcc(*'FFV1')
+    video = cv2.VideoWriter(temp, fourcc, fps, (width, height))
 
+    if not video.isOpened():
+        raise RuntimeError("Gagal membuka VideoWriter.")
 
-    # Sisipkan header pada frame pertama (pixel sekuensial)
-    header_bits = ''.join(format(byte, '08b') for byte in header)
-    header_length = len(header_bits)
-    bits_embedded = 0
-
-    for i in range(header_frame.shape[0]):
-        for j in range(header_frame.shape[1]):
-            for k in range(3):  # Untuk setiap channel (R, G, B)
-                if bits_embedded < header_length:
-                    original_pixel = header_frame[i, j, k]
-                    modified_pixel = (original_pixel & 0xFE) | int(header_bits[bits_embedded])
-                    header_frame[i, j, k] = modified_pixel
-                    bits_embedded += 1
-                else:
-                    break
-            if bits_embedded >= header_length:
-                break
-        if bits_embedded >= header_length:
-            break
+    psnr_per_frame = []
+    frames_written = 0
 
-    # Simpan frame yang telah dimodifikasi
-    cv2.imwrite(header_frame_path, header_frame)
-    logging.info(f"Header disimpan pada frame {header_frame_index}. Total bit header: {header_length}")
+    # Frame yang sedang diproses, ditulis sesuai urutan begitu hasilnya tersedia
+    executor = frame_executor(workers)
+    pending = deque()
+    pending_limit = 2 * workers if executor else 0
 
-    # Sisipkan pesan utama pada frame selanjutnya
-    total_bits_embedded = 0
-    for i in selected_frames[1:]:  # Mulai dari frame kedua dalam urutan yang dipilih
-        frame_path = os.path.join(frame_folder, f"frame{i}.png")
-        frame = cv2.imread(frame_path)
+    def write_pending(limit):
+        nonlocal frames_written
+        while len(pending) > limit:
+            frame, psnr = frame_result(pending.popleft())
+            psnr_per_frame.append(psnr)
+            video.write(frame)
+            frames_written += 1
+
+    try:
+        for i, frame in enumerate(iter_frames(video_path)):
+            if i == header_frame_index:
+                original_frame = frame.copy()
+                header_length = encode_header_in_frame(frame, header)
+                logging.info(f"Header disisipkan pada frame {i}. Total bit header: {header_length}")
+                pending.append((frame, calculate_psnr(original_frame, frame)))
+            elif i in plan:
+                args = (frame, message[plan[i]:plan[i] + frame_bytes], i, sequential_pixels, key)
+                pending.append(executor.submit(embed_carrier_frame, *args) if executor else embed_carrier_frame(*args))
+            else:
+                pending.append((frame, float('inf')))  # Frame tidak berubah
 
-        if frame is None:
-            logging.error(f"Frame {i} gagal dimuat dari {frame_path}.")
-            continue  # Lewati frame jika tidak bisa dimuat
+            write_pending(pending_limit)
 
-        # Sisipkan pesan ke dalam frame
-        logging.info(f"message potong: {message[total_bits_embedded // 8:]}")
-        bits_embedded = encode_message_in_frame(frame, message[total_bits_embedded // 8:], i, sequential_pixels, seed=key)
-        total_bits_embedded += bits_embedded
+        write_pending(0)
+    finally:
+        video.release()
+        if executor:
+            executor.shutdown(cancel_futures=True)
 
-        # Simpan frame yang telah dimodifikasi
-        cv2.imwrite(frame_path, frame)
-        debug_frame_path = os.path.join("debug_frames", f"frame{i}_debug.png")
-        cv2.imwrite(debug_frame_path, frame)
+    logging.info(f"Video berhasil disimpan di: {temp}")
 
-        logging.info(f"Frame {i} telah disisipi {bits_embedded} bit pesan dan disimpan ke {frame_path}.")
-        logging.info(f"Salinan frame debug disimpan di: {debug_frame_path}")
+    if frames_written <= max([header_frame_index, *plan]):
+        raise RuntimeError(
+            f"Video hanya memiliki {frames_written} frame, tidak semua frame pembawa pesan ditemukan."
+        )
 
-        # Jika semua bit pesan telah disisipkan, hentikan proses
-        if total_bits_embedded >= message_length:
-            break
+    # Ekstraksi menyusun ulang urutan frame acak dari jumlah frame video hasil
+    if not sequential_frames and frames_written != frame_count:
+        raise RuntimeError(
+            f"Jumlah frame yang ditulis ({frames_written}) berbeda dengan jumlah frame video ({frame_count})."
+        )
 
-    # Buat video dari frame
-    cap = cv2.VideoCapture(video_path)
-    # Ambil FPS
-    fps = cap.get(cv2.CAP_PROP_FPS)
-    cap.release()
-    logging.info(f"FPS video: {fps}")
-    create_video_from_frames(frame_folder, output_video_path, fps)
-    
-    temp = output_video_path.replace(".avi", "_noaudio.avi") 
     command = [
         "ffmpeg",
         "-i", temp,  # Tanpa tanda kutip berlebih
@@ -388,9 +529,6 @@ def embed_message_in_video(video_path, file_to_embed, output_video_path, key=Non
         logging.error(f"Gagal menggabungkan audio dan video: {e}")
         raise RuntimeError(f"Gagal menggabungkan audio dan video: {e}")
     
-    # Hitung PSNR antara video asli dan video stego
-    avg_psnr, psnr_per_frame = calculate_average_psnr(video_path)
-    
     # Hitung rata-rata PSNR dengan mengabaikan nilai inf
     avg_psnr_fixed = calculate_average_psnr_fixed(psnr_per_frame)
     
@@ -400,7 +538,7 @@ def embed_message_in_video(video_path, file_to_embed, output_video_path, key=Non
     return avg_psnr_fixed, psnr_per_frame
 
 # Fungsi utama untuk mengekstrak pesan dari video
-def extract_message_from_video(video_path, key=None, use_encryption=False):
+def extract_message_from_video(video_path, key=None, use_encryption=False, workers=1):
     """
     Mengekstrak pesan dari video.
     
@@ -408,6 +546,7 @@ def extract_message_from_video(video_path, key=None, use_encryption=False):
     - video_path: Path ke video yang akan diekstrak pesannya.
     - key: Kunci untuk dekripsi atau seed untuk randomisasi.
     - use_encryption: True jika pesan dienkripsi, False jika tidak.
+    - workers: Jumlah proses untuk mengekstrak pesan dari frame secara paralel.
     
     Returns:
     - message (bytes): Pesan yang diekstrak.
@@ -418,18 +557,14 @@ def extract_message_from_video(video_path, key=None, use_encryption=False):
     logging.info(f"key: {key}")
     logging.info(f"use_encryption: {use_encryption}")
     
-    frame_folder = "tmp_frames_extract"
-    audio_path = "tmp/audio_extract.mp3"
-    
-    # Ekstrak frame dan audio dari video
-    frame_count = extract_frames(video_path, frame_folder)
-    extract_audio(video_path, audio_path)
+    # Frame dibaca langsung dari video hanya jika dibutuhkan, audio tidak diperlukan
+    frame_count, _, width, height = get_video_info(video_path)
     logging.info(f"Total frame dalam video: {frame_count}")
     
     # Tentukan urutan frame berdasarkan key
     if key:
-        random.seed(sum(ord(char) for char in key))  # Gunakan key sebagai seed
-        frame_order = random.sample(range(frame_count), frame_count)  # Frame acak
+        rng = random.Random(sum(ord(char) for char in key))  # Gunakan key sebagai seed
+        frame_order = rng.sample(range(frame_count), frame_count)  # Frame acak
         logging.info(f"Menggunakan seed dari key untuk memilih frame acak. Urutan frame: {frame_order}")
     else:
         frame_order = list(range(frame_count))  # Frame sekuensial
@@ -437,8 +572,7 @@ def extract_message_from_video(video_path, key=None, use_encryption=False):
 
     # Cari header pada frame pertama yang dipilih
     header_frame_index = frame_order[0]  # Frame pertama dalam urutan yang dipilih
-    header_frame_path = os.path.join(frame_folder, f"frame{header_frame_index}.png")
-    header_frame = cv2.imread(header_frame_path)
+    header_frame = read_frame(video_path, header_frame_index)
     
     if header_frame is None:
         logging.error(f"Gagal membaca frame {header_frame_index} yang berisi header.")
@@ -456,8 +590,7 @@ def extract_message_from_video(video_path, key=None, use_encryption=False):
     if not header_data or not header_data.startswith(b"FILE_NAME:"):
         logging.info("Header tidak ditemukan atau tidak valid pada frame pertama yang dipilih secara acak. Mencoba pada frame 0.")
         header_frame_index = 0  # Frame 0 (frame pertama secara sekuensial)
-        header_frame_path = os.path.join(frame_folder, f"frame{header_frame_index}.png")
-        header_frame = cv2.imread(header_frame_path)
+        header_frame = read_frame(video_path, header_frame_index)
         
         if header_frame is None:
             logging.error(f"Gagal membaca frame {header_frame_index} yang berisi header.")
@@ -500,31 +633,45 @@ def extract_message_from_video(video_path, key=None, use_encryption=False):
 
     # Dekode pesan
     total_msg_length = msg_len
-    message = b""
-    
-    bits_extracted = 0
 
     # Tentukan sequential_pixels berdasarkan method_code
     sequential_pixels = method_code.endswith("1")  # True jika pixel sekuensial, False jika acak
+    logging.info(f"sequential_pixels: {sequential_pixels}")
 
-    # Ekstrak pesan dari frame selanjutnya (mulai dari frame kedua)
-    for i in frame_order:
-        frame_path = os.path.join(frame_folder, f"frame{i}.png")
-        frame = cv2.imread(frame_path)
+    # Hanya frame yang memuat msg_len byte pertama yang dibaca, jumlah byte tiap frame
+    # sudah diketahui sehingga frame dapat diekstrak secara independen
+    frame_plan = plan_extract_frames(frame_order, total_msg_length, width * height * 3)
+    frame_lengths = dict(frame_plan)
+    logging.info(f"Frame yang dibaca untuk ekstraksi: {[i for i, _ in frame_plan]}")
 
-        if frame is None:
-            logging.warning(f"Gagal membaca frame {i}, berhenti ekstraksi.")
-            break
-        
-        # Ekstrak pesan dari frame
-        logging.info(f"Ekstrak pesan dari frame {i}")
-        logging.info(f"sequential_pixels: {sequential_pixels}")
-        extracted_data = decode_message_from_frame(frame, (total_msg_length - bits_extracted), sequential_pixels, seed=key)
-        message += extracted_data
-        bits_extracted += len(extracted_data)
+    # Potongan pesan disusun kembali sesuai urutan frame
+    executor = frame_executor(workers)
+    pending = deque()
+    pending_limit = 2 * workers if executor else 0
+    extracted_parts = []
+
+    try:
+        # Ekstrak pesan dari frame selanjutnya (mulai dari frame kedua)
+        for i, frame in read_frames(video_path, [i for i, _ in frame_plan]):
+            if frame is None:
+                logging.warning(f"Gagal membaca frame {i}, berhenti ekstraksi.")
+                break
+            
+            # Ekstrak pesan dari frame
+            logging.info(f"Ekstrak pesan dari frame {i}")
+            args = (frame, frame_lengths[i], sequential_pixels, key)
+            pending.append(executor.submit(decode_message_from_frame, *args) if executor else decode_message_from_frame(*args))
+
+            while len(pending) > pending_limit:
+                extracted_parts.append(frame_result(pending.popleft()))
+
+        while pending:
+            extracted_parts.append(frame_result(pending.popleft()))
+    finally:
+        if executor:
+            executor.shutdown(cancel_futures=True)
 
-        if bits_extracted >= total_msg_length:
-            break  # Hentikan jika sudah mendapatkan semua data
+    message = b"".join(extracted_parts)
 
     # Dekripsi pesan jika enkripsi diaktifkan
     if use_encryption and key:
@@ -574,59 +721,6 @@ def calculate_psnr(frame1, frame2):
     
     return psnr
 
-def calculate_average_psnr(original_video_path):
-    """
-    Menghitung PSNR rata-rata antara video asli dan video stego per frame.
-    
-    Parameters:
-    - original_video_path: Path ke video asli.
-    - stego_video_path: Path ke video stego.
-    
-    Returns:
-    - avg_psnr: Nilai PSNR rata-rata dalam dB.
-    - psnr_per_frame: List nilai PSNR untuk setiap frame.
-    """
-    logging.info("Menghitung PSNR antara video asli dan video stego per frame.")
-    
-    # Ekstrak frame dari video asli
-    original_frame_folder = "tmp_original_frames"
-    original_frame_count = extract_frames(original_video_path, original_frame_folder)
-    
-    # Ekstrak frame dari video stego
-    stego_frame_folder = "tmp_frames"
-    stego_frame_count = original_frame_count  # Jumlah frame harus sama
-    
-    if original_frame_count != stego_frame_count:
-        raise ValueError("Jumlah frame video asli dan video stego tidak sama.")
-    
-    total_psnr = 0.0
-    frame_count = 0
-    psnr_per_frame = []  # List untuk menyimpan nilai PSNR per frame
-    
-    # Hitung PSNR untuk setiap frame
-    for i in range(original_frame_count):
-        original_frame_path = os.path.join(original_frame_folder, f"frame{i}.png")
-        stego_frame_path = os.path.join(stego_frame_folder, f"frame{i}.png")
-        
-        original_frame = cv2.imread(original_frame_path)
-        stego_frame = cv2.imread(stego_frame_path)
-        
-        if original_frame is None or stego_frame is None:
-            logging.warning(f"Frame {i} tidak bisa dibaca, dilewati.")
-            continue
-        
-        psnr = calculate_psnr(original_frame, stego_frame)
-        psnr_per_frame.append(psnr)  # Simpan nilai PSNR untuk frame ini
-        total_psnr += psnr
-        frame_count += 1
-    
-    # Hitung PSNR rata-rata
-    avg_psnr = total_psnr / frame_count if frame_count > 0 else 0
-    logging.info(f"PSNR rata-rata: {avg_psnr} dB")
-    logging.info(f"Nilai PSNR per frame: {psnr_per_frame}")
-    
-    return avg_psnr, psnr_per_frame
-
 def calculate_average_psnr_fixed(psnr_per_frame):
     """
     Menghitung rata-rata PSNR dengan mengabaikan nilai infinity.